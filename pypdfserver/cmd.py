@@ -8,6 +8,7 @@ import shlex
 from prompt_toolkit import PromptSession
 from prompt_toolkit.output import DummyOutput
 from prompt_toolkit.completion import WordCompleter
+from datetime import datetime
 from typing import Callable
 
 class PromptShell:
@@ -80,21 +81,23 @@ class CmdLib(PromptShell):
         match cmd:
             case "list":
                 s = ["Currently running tasks"]
-                for t in pdf_worker.Task.task_list:
+                for t in pdf_worker.Task.registry.tasks():
                     s.append(f"{t.state.name:>18}   {str(t):<40}")
                 logger.info('\n'.join(s))
             case "clean":
                 pdf_worker.clean()
             case "abort":
-                for t in pdf_worker.Task.task_list:
-                    if not type(t) == pdf_worker.Task and t.state in [pdf_worker.TaskState.CREATED, pdf_worker.TaskState.SCHEDULED, pdf_worker.TaskState.WAITING]:
+                for t in pdf_worker.Task.registry.by_state(pdf_worker.TaskState.CREATED, pdf_worker.TaskState.SCHEDULED, pdf_worker.TaskState.WAITING, 
+                                                               pdf_worker.TaskState.RUNNING):
+                    if not type(t) == pdf_worker.Task:
                         t.try_abort()
             case "clear":
-                for t in pdf_worker.Task.task_list.copy():
+                for t in pdf_worker.Task.registry.tasks():
                     if t.state != pdf_worker.TaskState.RUNNING:
                         logger.debug(f"Forced removed tasks '{str(t)}' (state {t.state})")
-                        pdf_worker.Task.task_list.remove(t)
-                        t.clean_up()    
+                        pdf_worker.Task.registry.remove(t)
+                        if isinstance(t, pdf_worker.Task):
+                            t.clean_up()
             case _:
                 logger.info(f"Syntax: tasks list|clean|clear|abort")
         
@@ -109,11 +112,8 @@ class CmdLib(PromptShell):
                     s.append(p.name)
                 logger.info('\n'.join(s)) 
             case "clean":
-                artifacts: list[Path] = []
-                for t in pdf_worker.Task.task_list:
-                    for a in t.artifacts.values():
-                        if isinstance(a, pdf_worker.FileArtifact):
-                            artifacts.append(a.path)
+                # Archived tasks may still be alive if other tasks depend on them, so collect the paths from the artifacts itself
+                artifacts: list[Path] = [a.path for a in list(pdf_worker.FileArtifact.instances)]
                 artifacts_files: list[Path] = [p for p in pdf_worker.Artifact.temp_dir.iterdir() if p.is_file()]
                 garbage_artifacts = set(artifacts_files).difference(artifacts)
                 i = 0
@@ -125,6 +125,37 @@ class CmdLib(PromptShell):
                 logger.info(f"Removed {i} orphan artifacts")
             case _:
                 logger.info(f"Syntax: artifacts list|clean")
+
+    def cmd_spool(self, *args: str) -> None:
+        cmd = args[0].lower() if len(args) > 0 else ""
+        if pdf_worker.export_spool is None:
+            logger.info(f"The upload spool is disabled")
+            return
+        match cmd:
+            case "list":
+                s = ["Spooled uploads"]
+                for e in list(pdf_worker.export_spool.entries):
+                    s.append(f"{datetime.fromtimestamp(e.t_created).strftime('%Y-%m-%d %H:%M:%S')}   {e.file_name:<40} {str(e.destination)}")
+                logger.info('\n'.join(s))
+            case "retry":
+                pdf_worker.export_spool.retry()
+            case _:
+                logger.info(f"Syntax: spool list|retry")
+
+    def cmd_cache(self, *args: str) -> None:
+        cmd = args[0].lower() if len(args) > 0 else ""
+        if pdf_worker.ocr_cache is None:
+            logger.info(f"The OCR cache is disabled")
+            return
+        match cmd:
+            case "info":
+                num_entries, size = pdf_worker.ocr_cache.size
+                logger.info(f"The OCR cache holds {num_entries} results ({size/1024**2:.1f} MB of {pdf_worker.ocr_cache.max_size/1024**2:.0f} MB) in '{pdf_worker.ocr_cache.path}'")
+            case "clear":
+                pdf_worker.ocr_cache.clear()
+                logger.info(f"Cleared the OCR cache")
+            case _:
+                logger.info(f"Syntax: cache info|clear")
         
 
 def start_pyPDFserver():
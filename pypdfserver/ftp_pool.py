@@ -0,0 +1,191 @@
+""" Implements a pool of persistent connections to external FTP servers """
+
+from .core import *
+
+import ftplib
+import ssl
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, NamedTuple, cast
+
+class ReusedSessionFTP_TLS(ftplib.FTP_TLS):
+    """ FTP_TLS client reusing the TLS session of the control connection for the data connections """
+
+    def ntransfercmd(self, cmd, rest=None):
+        conn, size = ftplib.FTP.ntransfercmd(self, cmd, rest)
+        if self._prot_p: # type: ignore
+            conn = self.context.wrap_socket(conn, server_hostname=self.host, session=cast(ssl.SSLSocket, self.sock).session) # type: ignore
+        return conn, size
+
+def remote_file_exists(ftp: ftplib.FTP, file_name: str) -> bool:
+    """ 
+    Check if a file exists in the current working directory without listing the whole directory. Uses MLST and falls back
+    to SIZE if the server does not support it
+    """
+    try:
+        ftp.sendcmd(f"MLST {file_name}")
+        return True
+    except ftplib.error_perm as ex:
+        if str(ex)[:3] == "550":
+            return False
+        elif str(ex)[:3] not in ["500", "501", "502", "504"]:
+            raise
+    # Some servers refuse SIZE in ASCII mode
+    ftp.voidcmd("TYPE I")
+    try:
+        ftp.size(file_name)
+        return True
+    except ftplib.error_perm as ex:
+        if str(ex)[:3] == "550":
+            return False
+        raise
+
+def remote_file_size(ftp: ftplib.FTP, file_name: str) -> int|None:
+    """ Returns the size of a file in the current working directory or None if it does not exist """
+    ftp.voidcmd("TYPE I")
+    try:
+        return ftp.size(file_name)
+    except ftplib.error_perm as ex:
+        if str(ex)[:3] == "550":
+            return None
+        raise
+
+def upload_file(ftp: ftplib.FTP, path: Path, file_name: str, resume: bool = False) -> None:
+    """ 
+    Upload a file under a temporary name and rename it afterwards, so that incomplete uploads never appear under the final name.
+    If resume is set, an existing temporary file is continued from the size reported by the server
+    """
+    temp_name = f"{file_name}.part"
+    offset = 0
+    if (size := remote_file_size(ftp, temp_name)) is not None:
+        if resume and size <= path.stat().st_size:
+            offset = size
+        else:
+            ftp.delete(temp_name)
+    with open(path, "rb") as f:
+        if offset > 0:
+            f.seek(offset)
+            try:
+                ftp.storbinary(f"STOR {temp_name}", f, rest=offset)
+            except ftplib.error_perm as ex:
+                # The server does not support REST for STOR
+                logger.debug(f"Failed to resume the upload of '{file_name}' at {offset} bytes ({str(ex)}). Restarting the upload")
+                offset = 0
+                f.seek(0)
+        if offset == 0:
+            ftp.storbinary(f"STOR {temp_name}", f)
+    ftp.rename(temp_name, file_name)
+
+class FTPConnectionKey(NamedTuple):
+    host: str
+    port: int
+    username: str
+    password: str
+    folder: str
+    tls: bool
+
+    def __str__(self) -> str:
+        return f"{self.host}:{self.port}@{self.username}:{self.folder}"
+
+class FTPConnectionPool:
+    """
+    Keeps logged in connections to FTP servers for reuse. Connections are identified by address, credentials and folder.
+    Idle connections are checked with NOOP before they are handed out again and closed once they exceed the idle time
+    """
+
+    def __init__(self, idle_time: float = 60, max_idle_connections: int = 4, timeout: float = 30) -> None:
+        self.idle_time = idle_time
+        self.max_idle_connections = max_idle_connections
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self._idle: defaultdict[FTPConnectionKey, list[tuple[ftplib.FTP, float]]] = defaultdict(list)
+
+    @contextmanager
+    def connection(self, address: tuple[str, int], username: str, password: str, folder: str, tls: bool) -> Iterator[ftplib.FTP]:
+        """
+        Get a logged in connection with the given folder as working directory. The connection is returned to the pool afterwards,
+        unless an FTP error occured
+        """
+        key = FTPConnectionKey(address[0], address[1], username, password, folder, tls)
+        ftp = self._acquire(key)
+        try:
+            yield ftp
+        except ftplib.all_errors:
+            FTPConnectionPool._close(ftp)
+            raise
+        except BaseException:
+            self._release(key, ftp)
+            raise
+        else:
+            self._release(key, ftp)
+
+    def _acquire(self, key: FTPConnectionKey) -> ftplib.FTP:
+        self.evict()
+        while True:
+            with self.lock:
+                if len(idle := self._idle.get(key, [])) == 0:
+                    break
+                ftp, _ = idle.pop()
+            try:
+                ftp.voidcmd("NOOP")
+            except ftplib.all_errors as ex:
+                logger.debug(f"Discarding stale connection to '{str(key)}': {str(ex)}")
+                FTPConnectionPool._close(ftp)
+                continue
+            logger.debug(f"Reusing connection to '{str(key)}'")
+            return ftp
+        return self._connect(key)
+
+    def _connect(self, key: FTPConnectionKey) -> ftplib.FTP:
+        ftp = ReusedSessionFTP_TLS() if key.tls else ftplib.FTP()
+        try:
+            ftp.connect(key.host, key.port, timeout=self.timeout)
+            if isinstance(ftp, ftplib.FTP_TLS):
+                ftp.auth()
+                ftp.prot_p()
+            ftp.login(user=key.username, passwd=key.password)
+            ftp.cwd(key.folder)
+        except BaseException:
+            FTPConnectionPool._close(ftp)
+            raise
+        logger.debug(f"Connected to FTP server '{str(key)}' ('{ftp.getwelcome()}')")
+        return ftp
+
+    def _release(self, key: FTPConnectionKey, ftp: ftplib.FTP) -> None:
+        with self.lock:
+            if self.idle_time > 0 and len(self._idle.get(key, [])) < self.max_idle_connections:
+                self._idle[key].append((ftp, time.monotonic()))
+                return
+        FTPConnectionPool._close(ftp)
+
+    def evict(self) -> None:
+        """ Close all connections exceeding the idle time """
+        expired: list[ftplib.FTP] = []
+        with self.lock:
+            t_min = time.monotonic() - self.idle_time
+            for key in list(self._idle.keys()):
+                expired.extend([ftp for ftp, t in self._idle[key] if t < t_min])
+                self._idle[key] = [(ftp, t) for ftp, t in self._idle[key] if t >= t_min]
+                if len(self._idle[key]) == 0:
+                    del self._idle[key]
+        for ftp in expired:
+            FTPConnectionPool._close(ftp, quit=True)
+
+    def close_all(self) -> None:
+        with self.lock:
+            connections = [ftp for idle in self._idle.values() for ftp, _ in idle]
+            self._idle.clear()
+        for ftp in connections:
+            FTPConnectionPool._close(ftp, quit=True)
+
+    @staticmethod
+    def _close(ftp: ftplib.FTP, quit: bool = False) -> None:
+        if quit:
+            try:
+                ftp.quit()
+            except (*ftplib.all_errors, AttributeError):
+                pass
+        ftp.close()
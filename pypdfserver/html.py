@@ -7,7 +7,7 @@ from flask import Flask, render_template_string, request
 
 from .core import *
 from . import __version__
-from .pdf_worker import Task, TaskState
+from .pdf_worker import Task, TaskRecord, TaskState
 
 app = Flask(__name__)
 
@@ -71,7 +71,7 @@ class Webinterface:
                             {
                                 "uuid": t.uuid,
                                 "name": t.name,
-                                "error": t.error.message if t.error is not None else "",
+                                "error": t.error_message if t.error_message is not None else "",
                                 "desc": t.desc,
                                 "time_started": Webinterface.format_datetime(t.t_start),
                                 "time_finished": Webinterface.format_datetime(t.t_end),
@@ -86,7 +86,7 @@ class Webinterface:
 
 
     @classmethod
-    def get_task_group_t_created(cls, tasks: list[Task]) -> datetime|None:
+    def get_task_group_t_created(cls, tasks: list[Task|TaskRecord]) -> datetime|None:
         t_created = datetime.max
         for t in tasks:
             if t.t_created is None:
@@ -97,7 +97,7 @@ class Webinterface:
         return t_created
     
     @classmethod
-    def get_task_group_t_start(cls, tasks: list[Task]) -> datetime|None:
+    def get_task_group_t_start(cls, tasks: list[Task|TaskRecord]) -> datetime|None:
         start_time = datetime.max
         for t in tasks:
             if t.t_start is None:
@@ -108,7 +108,7 @@ class Webinterface:
         return start_time
     
     @classmethod
-    def get_task_group_t_end(cls, tasks: list[Task]) -> datetime|None:
+    def get_task_group_t_end(cls, tasks: list[Task|TaskRecord]) -> datetime|None:
         end_time = datetime.min
         for t in tasks:
             if t.t_end is None:
@@ -119,7 +119,7 @@ class Webinterface:
         return end_time
     
     @classmethod
-    def get_task_group_runtime(cls, tasks: list[Task]) -> timedelta|None:
+    def get_task_group_runtime(cls, tasks: list[Task|TaskRecord]) -> timedelta|None:
         t_start, t_end = cls.get_task_group_t_start(tasks), cls.get_task_group_t_end(tasks)
         if t_start is None or t_end is None:
             return None
@@ -159,14 +159,14 @@ class Webinterface:
             return f"{seconds} s"
 
     @classmethod
-    def get_tasks(cls) -> tuple[tuple[int, int, int], dict[str, tuple[str, TaskState, list[Task]]]]:
+    def get_tasks(cls) -> tuple[tuple[int, int, int], dict[str, tuple[str, TaskState, list[Task|TaskRecord]]]]:
         """ Returns the tasks grouped by their group
         
         (num_total_tasks, num_scheduled_tasks, num_failed_tasks), {group_uuid -> (group_name, list[tasks])}
         """
-        task_groups: dict[str, tuple[str, list[Task]]] = {}
+        task_groups: dict[str, tuple[str, list[Task|TaskRecord]]] = {}
         i_total, i_scheduled, i_failed = 0, 0, 0
-        for t in Task.task_list:
+        for t in Task.registry.tasks():
             if t.hidden:
                 continue
             i_total += 1
@@ -0,0 +1,161 @@
+""" Implements a persistent cache for OCR results, so that documents sent again do not need to be processed again """
+
+from .core import *
+
+import hashlib
+import importlib.metadata
+import json
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+from pathlib import Path
+from typing import Any
+
+def file_sha256(path: Path, chunk_size: int = 1024**2) -> str:
+    """ Returns the SHA-256 hex digest of a file """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while (chunk := f.read(chunk_size)):
+            h.update(chunk)
+    return h.hexdigest()
+
+class HashingWriter:
+    """
+    Wraps a file object opened for writing and computes the SHA-256 hash of all written data. The digest is passed to the callback
+    once the file is closed
+    """
+
+    def __init__(self, file, callback) -> None:
+        self._file = file
+        self._hash = hashlib.sha256()
+        self._callback = callback
+
+    def write(self, data: bytes) -> int:
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._file.close()
+        if self._callback is not None:
+            self._callback(self._hash.hexdigest())
+            self._callback = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._file, name)
+
+class OCRCache:
+    """
+    Stores OCR results on disk keyed by the hash of the input file, the OCR parameters and the versions of OCRmyPDF and tesseract.
+    Results are always copied into and out of the cache, so that cached results never share an inode with artifacts or exported
+    files. Once the cache exceeds its maximum size, the least recently used results are removed
+    """
+
+    def __init__(self, path: Path, max_size: int) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self._versions: dict[str, str|None]|None = None
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        for p in self.path.glob("*.tmp"):
+            p.unlink(missing_ok=True)
+
+    @property
+    def versions(self) -> dict[str, str|None]:
+        """ The versions of OCRmyPDF and tesseract. Determined once on first use """
+        with self.lock:
+            if self._versions is None:
+                self._versions = {"ocrmypdf": OCRCache._get_ocrmypdf_version(), "tesseract": OCRCache._get_tesseract_version()}
+                logger.debug(f"OCR cache: Using ocrmypdf {self._versions['ocrmypdf']} and tesseract {self._versions['tesseract']}")
+            return self._versions
+
+    def key(self, input_hash: str, params: dict[str, Any]) -> str:
+        """ Returns the cache key for the given input hash and OCR parameters """
+        data = json.dumps({"input": input_hash, "params": params, "versions": self.versions}, sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, path: Path) -> bool:
+        """ Write the cached result for the key to the given path. Returns False if there is no cached result """
+        cache_path = self.path / f"{key}.pdf"
+        temp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            shutil.copyfile(cache_path, temp_path)
+            os.replace(temp_path, path)
+        except FileNotFoundError:
+            # Evicted in the meantime
+            temp_path.unlink(missing_ok=True)
+            return False
+        # Mark as recently used
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+        return True
+
+    def put(self, key: str, path: Path) -> None:
+        """ Add the file as result for the given key """
+        cache_path = self.path / f"{key}.pdf"
+        temp_path = self.path / f"{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            shutil.copyfile(path, temp_path)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            temp_path.unlink(missing_ok=True)
+            logger.warning(f"Failed to add an OCR result to the cache", exc_info=True)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """ Remove the least recently used results until the cache size is below the limit """
+        with self.lock:
+            entries: list[tuple[float, int, Path]] = []
+            for p in self.path.glob("*.pdf"):
+                try:
+                    stat = p.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, p))
+            size = sum([e[1] for e in entries])
+            for _, entry_size, p in sorted(entries, key=lambda e: e[0]):
+                if size <= self.max_size:
+                    break
+                p.unlink(missing_ok=True)
+                size -= entry_size
+                logger.debug(f"OCR cache: Evicted '{p.name}'")
+
+    def clear(self) -> None:
+        """ Remove all cached results """
+        with self.lock:
+            for p in self.path.glob("*.pdf"):
+                p.unlink(missing_ok=True)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """ Returns the number of cached results and their total size in bytes """
+        sizes = []
+        for p in self.path.glob("*.pdf"):
+            try:
+                sizes.append(p.stat().st_size)
+            except FileNotFoundError:
+                continue
+        return len(sizes), sum(sizes)
+
+    @staticmethod
+    def _get_ocrmypdf_version() -> str|None:
+        try:
+            return importlib.metadata.version("ocrmypdf")
+        except importlib.metadata.PackageNotFoundError:
+            return None
+
+    @staticmethod
+    def _get_tesseract_version() -> str|None:
+        try:
+            result = subprocess.run(["tesseract", "--version"], capture_output=True, text=True, timeout=30)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        lines = (result.stdout or result.stderr).strip().splitlines()
+        return lines[0].strip() if len(lines) > 0 else None
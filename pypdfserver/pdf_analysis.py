@@ -0,0 +1,88 @@
+""" Implements the analysis of PDF pages, for example to detect blank pages or pages already containing text """
+
+from .core import *
+
+import numpy as np
+import pikepdf
+import pypdfium2
+import threading
+from pathlib import Path
+
+# PDFium is not thread safe
+_pdfium_lock = threading.Lock()
+
+# Operators showing text in a content stream
+_text_operators = "Tj TJ ' \""
+
+def ink_coverage(image: np.ndarray, margin: float = 0.05, contrast: int = 64, min_paper: int = 200) -> float:
+    """
+    Returns the fraction of pixels of a grayscale image which are considerably darker than the paper. A margin on each side is
+    ignored to exclude shadows at the edges of scanned pages. If the paper level is itself dark (for example on black,
+    inverted or full-bleed photo pages), the page is never considered blank and 1.0 is returned
+    """
+    if image.ndim == 3:
+        image = image[..., 0]
+    h, w = image.shape
+    dy, dx = int(h*margin), int(w*margin)
+    image = image[dy:h-dy, dx:w-dx]
+    if image.size == 0:
+        return 0.0
+    paper = np.percentile(image, 95)
+    if paper < min_paper:
+        return 1.0
+    return np.count_nonzero(image < paper - contrast) / image.size
+
+def find_blank_pages(path: Path, threshold: float, dpi: int = 50) -> tuple[int, list[int]]:
+    """
+    Render the pages of a PDF in low resolution and detect pages with an ink coverage below the given threshold (as fraction).
+    Returns the page count and the indices of the blank pages. Raises pypdfium2.PdfiumError if the file can not be opened
+    """
+    blank_pages: list[int] = []
+    with _pdfium_lock:
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            num_pages = len(pdf)
+            for i in range(num_pages):
+                page = pdf[i]
+                try:
+                    image = page.render(scale=dpi/72, grayscale=True).to_numpy()
+                finally:
+                    page.close()
+                if ink_coverage(image) < threshold:
+                    blank_pages.append(i)
+        finally:
+            pdf.close()
+    return num_pages, blank_pages
+
+def _has_text(obj: pikepdf.Object|pikepdf.Page, forms: dict[tuple[int, int], bool]) -> bool:
+    """ 
+    Check if the content stream of a page or form XObject or any form XObject used by it shows text. The results for
+    form XObjects are stored in the given dict, as they are often shared between pages
+    """
+    if len(pikepdf.parse_content_stream(obj, _text_operators)) > 0:
+        return True
+    resources = obj.get("/Resources", None)
+    if not isinstance(resources, pikepdf.Dictionary) or not isinstance(xobjects := resources.get("/XObject", None), pikepdf.Dictionary):
+        return False
+    for xobj in xobjects.values():
+        if not isinstance(xobj, pikepdf.Stream) or xobj.get("/Subtype", None) != pikepdf.Name.Form:
+            continue
+        if xobj.objgen not in forms:
+            forms[xobj.objgen] = False # Guards against cyclic references
+            forms[xobj.objgen] = _has_text(xobj, forms)
+        if forms[xobj.objgen]:
+            return True
+    return False
+
+def find_text_pages(path: Path) -> tuple[int, list[int]]:
+    """
+    Inspect the content streams of a PDF without rendering it and find the pages which already show text (for example
+    born-digital pages or pages with an OCR layer). Returns the page count and the indices of the pages with text
+    """
+    text_pages: list[int] = []
+    with pikepdf.open(path) as pdf:
+        forms: dict[tuple[int, int], bool] = {}
+        for i, page in enumerate(pdf.pages):
+            if _has_text(page, forms):
+                text_pages.append(i)
+        return len(pdf.pages), text_pages
@@ -1,19 +1,35 @@
+import atexit
 import ftplib
+import hashlib
+import itertools
+import json
 import logging
-import ocrmypdf
-import ocrmypdf.exceptions
+import os
 import pikepdf
+import platformdirs
+import pypdfium2
+import shutil
+import signal
+import subprocess
+import sys
 import tempfile
 import threading
+import time
 import uuid
 import weakref
+from collections import defaultdict
 from datetime import datetime, timedelta
 from enum import Enum
 from pathlib import Path
-from queue import Queue, Empty
-from typing import cast
+from queue import PriorityQueue, Empty
+from typing import cast, NamedTuple, TypeVar
 
 from .core import *
+from . import worker_process
+from .ftp_pool import FTPConnectionPool, remote_file_exists, upload_file
+from .ocr_cache import OCRCache, file_sha256
+from .pdf_analysis import find_blank_pages, find_text_pages
+from .upload_spool import UploadSpool
 
 ocrmypdf_logger = logging.getLogger("ocrmypdf")
 ocrmypdf_logger.handlers.clear()
@@ -40,12 +56,27 @@ class TaskState(Enum):
         self._value_ = value      # behält den ursprünglichen Enum-Wert
         self.priority = priority # zusätzliches Attribut
 
+    @property
+    def is_final(self) -> bool:
+        """ True if the task has either finished or failed """
+        return self not in [TaskState.CREATED, TaskState.SCHEDULED, TaskState.WAITING, TaskState.RUNNING]
+
     @classmethod
     def merge_states(cls, *states: "TaskState") -> "TaskState":
         if len(states) == 0:
             raise ValueError(f"Can't merge zeros TaskStates")
         return max(states, key=lambda s: s.priority)
 
+class ResourceClass(Enum):
+    """
+    Defines which resource a task mainly uses. Each resource class is processed in its own lane with a separate
+    concurrency budget, so that for example uploads do not need to wait for a running OCR task
+    """
+    INSTANT = "instant"
+    IO = "io"
+    CPU_LIGHT = "cpu_light"
+    CPU_HEAVY = "cpu_heavy"
+
 class Artifact:
     """ 
     Implements an artifact class to pass results between tasks. Any subclass should implement garbage collection in the cleanup() method called when the 
@@ -55,11 +86,16 @@ class Artifact:
     temp_dir = pyPDFserver_temp_dir_path / "artifacts"
 
     def __init__(self, task: "Task|None", name: str, _log: bool = True) -> None:
-        self.task = task
+        # Only keep a weak reference to not keep finished tasks alive
+        self._task = weakref.ref(task) if task is not None else None
         self._name = name
         if _log:
             logger.debug(f"Created artifact '{name}'" + (f" for task '{str(task)}'" if task is not None else ""))
 
+    @property
+    def task(self) -> "Task|None":
+        return self._task() if self._task is not None else None
+
     @property
     def name(self) -> str:
         return self._name
@@ -84,6 +120,10 @@ class Artifact:
 
 Artifact.temp_dir.mkdir(exist_ok=True, parents=False)
 
+# The umask can only be read by setting it
+_umask = os.umask(0)
+os.umask(_umask)
+
 class FileArtifact(Artifact):
     """
     Implements a file artifact class to pass files between tasks. Access the data with the given .path attribute.
@@ -91,8 +131,12 @@ class FileArtifact(Artifact):
     
     """
 
+    instances: "weakref.WeakSet[FileArtifact]" = weakref.WeakSet()
+    copy_chunk_size = 1024**2
+
     def __init__(self, task: "Task|None", name: str) -> None:
         super().__init__(task, name, _log=False)
+        FileArtifact.instances.add(self)
 
         prefix = f"artifact_{name}"
         if self.task is not None:
@@ -101,6 +145,8 @@ class FileArtifact(Artifact):
         self._temp_file = tempfile.NamedTemporaryFile(dir=Artifact.temp_dir, prefix=prefix, suffix=".bin", delete=False)
         self._temp_file.close()
         self.path = Path(self._temp_file.name)
+        # SHA-256 hash of the content, if known (e.g. computed while receiving an upload)
+        self.sha256: str|None = None
 
         self._finalizer = weakref.finalize(self, FileArtifact._cleanup, self.path, self.name, str(self.task) if self.task is not None else None)
 
@@ -109,6 +155,22 @@ class FileArtifact(Artifact):
         except ValueError:
             logger.error(f"Failed to create FileArtifact '{self.name}': '{self.path}' is not in the temporary directory ('{Artifact.temp_dir}')")
 
+    @classmethod
+    def from_file(cls, path: Path, name: str, task: "Task|None" = None) -> "FileArtifact":
+        """ 
+        Create an artifact by moving the given file into the artifact store. If the file is located on another file system,
+        it is copied in chunks and removed afterwards
+        """
+        artifact = cls(task, name)
+        try:
+            os.replace(path, artifact.path)
+        except OSError:
+            with open(path, "rb") as f_src, open(artifact.path, "wb") as f_dst:
+                shutil.copyfileobj(f_src, f_dst, length=FileArtifact.copy_chunk_size)
+            path.unlink(missing_ok=True)
+            logger.debug(f"Copied '{path.name}' into the artifact store as it is located on another file system")
+        return artifact
+
     def cleanup(self) -> None:
         logger.debug(f"Cleanup for temporary artifact '{self.name}'"+ (f" of task '{str(self.task)}'" if self.task is not None else ""))
         if not self._temp_file.closed:
@@ -131,16 +193,57 @@ class FileArtifact(Artifact):
             logger.debug(f"Garbage collected temporary artifact '{name}'" + (f" of task '{task_name}'" if task_name is not None else ""))
 
 
+class PageSetArtifact(Artifact):
+    """ Holds a set of page indices of a document (for example its blank pages) """
+
+    def __init__(self, task: "Task|None", name: str) -> None:
+        super().__init__(task, name)
+        self.pages: list[int] = []
+        self.num_pages: int|None = None
+
+    def __str__(self) -> str:
+        return f"PageSetArtifact '{self.name}'"
+
+
 class ArtifactLink:
+    """ 
+    Links to an artifact of a task by its name. A link keeps the task alive until it is released. An acquired link
+    counts as consumer of the artifact, which is deleted once all consumers have released their links
+    """
 
     def __init__(self, artifact_name: str, task: "Task") -> None:
         self.artifact_name = artifact_name
-        self.task = task
+        self.task: Task|None = task
+        self.acquired = False
     
     def get(self) -> "Artifact":
+        if self.task is None:
+            raise ValueError(f"The link to artifact '{self.artifact_name}' has been released")
+        if self.artifact_name not in self.task.artifacts:
+            raise ValueError(f"The artifact '{self.artifact_name}' of task '{str(self.task)}' has already been removed")
         return self.task.artifacts[self.artifact_name]
+
+    def acquire(self) -> None:
+        """ Register the link as consumer of the artifact """
+        if self.task is None or self.acquired:
+            return
+        self.task.acquire_artifact(self.artifact_name)
+        self.acquired = True
+    
+    def release(self) -> None:
+        """ Release the reference to the task. Called when the consuming task has finished """
+        if self.task is None:
+            return
+        task, self.task = self.task, None
+        if self.acquired:
+            self.acquired = False
+            task.release_artifact(self.artifact_name)
     
     def __str__(self) -> str:
+        if self.task is None:
+            return f"Released link to '{self.artifact_name}'"
+        elif self.artifact_name not in self.task.artifacts:
+            return f"Link to removed artifact '{self.artifact_name}'"
         return f"Link to '{str(self.get())}'"
     
     def __repr__(self) -> str:
@@ -151,16 +254,162 @@ class FileArtifactLink(ArtifactLink):
     def get(self) -> FileArtifact:
         return cast(FileArtifact, super().get())
 
+class PageSetArtifactLink(ArtifactLink):
+
+    def get(self) -> PageSetArtifact:
+        return cast(PageSetArtifact, super().get())
+
+InputT = TypeVar("InputT", bound=Path|ArtifactLink|None)
+
+class TaskRecord:
+    """ 
+    Compact summary of a task which has reached a final state. Once a task is archived, the registry only keeps this record 
+    and the task itself (including its artifacts) is freed as soon as no other task depends on it anymore
+    """
+
+    __slots__ = ("uuid", "group", "hidden", "label", "name", "desc", "state", "t_created", "t_start", "t_end", 
+                 "error_message", "num_pages", "file_size")
+
+    def __init__(self, task: "Task") -> None:
+        self.uuid: str = task.uuid
+        self.group: str|None = task.group
+        self.hidden: bool = task.hidden
+        self.label: str = str(task)
+        self.name: str = task.name
+        self.desc: str = task.desc
+        self.state: TaskState = task.state
+        self.t_created: datetime = task.t_created
+        self.t_start: datetime|None = task.t_start
+        self.t_end: datetime|None = task.t_end
+        self.error_message: str|None = task.error_message
+        self.num_pages: int|None = task.num_pages
+        self.file_size: int|None = task.file_size
+
+    @property
+    def runtime(self) -> timedelta|None:
+        if self.t_start is None or self.t_end is None:
+            return None
+        return self.t_end - self.t_start
+
+    def __repr__(self) -> str:
+        return f"<{self.label} (archived)>"
+
+    def __str__(self) -> str:
+        return self.label
+
+class TaskRegistry:
+    """ 
+    Thread safe registry of tasks. Tasks are indexed by uuid, state and group. As tasks are registered on creation, 
+    the insertion order equals the creation order and expired tasks can be found without scanning the whole registry.
+    Tasks in a final state are replaced by a TaskRecord
+    """
+
+    def __init__(self, lock: threading.RLock) -> None:
+        self.lock = lock
+        self._tasks: dict[str, "Task|TaskRecord"] = {}
+        self._by_state: defaultdict[TaskState, dict[str, "Task|TaskRecord"]] = defaultdict(dict)
+        self._by_group: defaultdict[str, dict[str, "Task|TaskRecord"]] = defaultdict(dict)
+
+    def add(self, task: "Task") -> None:
+        with self.lock:
+            self._tasks[task.uuid] = task
+            self._by_state[task.state][task.uuid] = task
+            if task.group is not None:
+                self._by_group[task.group][task.uuid] = task
+
+    def archive(self, task: "Task") -> "TaskRecord|None":
+        """ Replace the task by a TaskRecord while keeping its position. Returns None if the task is not registered """
+        with self.lock:
+            if not isinstance(self._tasks.get(task.uuid, None), Task):
+                return None
+            record = TaskRecord(task)
+            self._tasks[task.uuid] = record
+            self._by_state[task.state][task.uuid] = record
+            if task.group is not None:
+                self._by_group[task.group][task.uuid] = record
+            return record
+
+    def remove(self, task: "Task|TaskRecord") -> bool:
+        """ Remove the task from the registry. Returns False if the task was not registered """
+        with self.lock:
+            if self._tasks.pop(task.uuid, None) is None:
+                return False
+            self._by_state[task.state].pop(task.uuid, None)
+            if task.group is not None:
+                group = self._by_group[task.group]
+                group.pop(task.uuid, None)
+                if len(group) == 0:
+                    del self._by_group[task.group]
+            return True
+    
+    def get(self, uuid: str) -> "Task|TaskRecord|None":
+        with self.lock:
+            return self._tasks.get(uuid, None)
+
+    def tasks(self) -> list["Task|TaskRecord"]:
+        """ Returns all tasks ordered by their creation time """
+        with self.lock:
+            return list(self._tasks.values())
+        
+    def by_state(self, *states: TaskState) -> list["Task|TaskRecord"]:
+        with self.lock:
+            return [t for s in states for t in self._by_state[s].values()]
+        
+    def by_group(self, group: str) -> list["Task|TaskRecord"]:
+        with self.lock:
+            return list(self._by_group[group].values()) if group in self._by_group else []
+        
+    def count(self, *states: TaskState) -> int:
+        """ Count the tasks in the given states or all tasks if no state is given """
+        with self.lock:
+            if len(states) == 0:
+                return len(self._tasks)
+            return sum([len(self._by_state[s]) for s in states])
+        
+    def expired(self, t_created: datetime) -> list["Task|TaskRecord"]:
+        """ Returns all tasks created before the given time """
+        with self.lock:
+            expired = []
+            for t in self._tasks.values():
+                if t.t_created >= t_created:
+                    break
+                expired.append(t)
+            return expired
+    
+    def update_state(self, task: "Task", old_state: TaskState) -> None:
+        """ Called by the task when its state changed """
+        with self.lock:
+            if self._tasks.get(task.uuid, None) is not task:
+                return
+            self._by_state[old_state].pop(task.uuid, None)
+            self._by_state[task.state][task.uuid] = task
+    
+    def __contains__(self, task: "Task|TaskRecord") -> bool:
+        with self.lock:
+            return task.uuid in self._tasks
+    
+    def __len__(self) -> int:
+        return len(self._tasks)
+
 class Task:
-    """ A task can define any workload scheduled to run asynchronously in the run() method. To pass results to other tasks, use the store_artifacts() method """
+    """ 
+    A task can define any workload scheduled to run asynchronously in the run() method. To pass results to other tasks, use the store_artifacts() method.
+
+    Tasks form a dependency graph: Each task counts its unresolved dependencies and is queued by the last dependency finishing.
+    All state transitions and changes to the graph are guarded by Task.lock. Once a task reaches a final state, it is archived:
+    The registry only keeps a TaskRecord and the task releases its links to other tasks
+    """
     
-    task_list: list["Task"] = []
     groups: dict[str, str] = {}
+    lock = threading.RLock()
+    registry = TaskRegistry(lock)
+    resource_class: ResourceClass = ResourceClass.CPU_HEAVY
 
     def __init__(self, group: str|None = None, group_name: str|None = None, hidden: bool = False) -> None:
-        self.state = TaskState.CREATED
+        self._state = TaskState.CREATED
         self.uuid = str(uuid.uuid4())
         self.dependencies: list[Task] = []
+        self.dependents: list[Task] = []
         self.external_dependencies: set[str] = set()
         self.t_created: datetime = datetime.now()
         self.t_start: datetime|None = None
@@ -169,41 +418,181 @@ class Task:
         self.error: TaskException|None = None
         self.group = group
         self.hidden = hidden
+        self.process: WorkerProcess|None = None
+        self.input_links: list[ArtifactLink] = []
+        self.num_pages: int|None = None
+        self.file_size: int|None = None
+        self._pending_dependencies = 0
+        self._artifact_consumers: defaultdict[str, int] = defaultdict(int)
 
-        Task.task_list.append(self)
+        Task.registry.add(self)
+
+    @property
+    def state(self) -> TaskState:
+        return self._state
+    
+    @state.setter
+    def state(self, val: TaskState) -> None:
+        self.set_state(val)
+
+    def set_state(self, state: TaskState, expected: list[TaskState]|None = None) -> bool:
+        """ 
+        Thread safe state transition. If expected is given, the state is only changed if the task is currently in one of the expected states.
+        When the task reaches a final state, its dependents are notified
+        """
+        with Task.lock:
+            if expected is not None and self._state not in expected:
+                return False
+            old_state = self._state
+            self._state = state
+            Task.registry.update_state(self, old_state)
+            if state.is_final and not old_state.is_final:
+                self._resolve_dependents()
+                # A running task is archived by the worker once run() has returned
+                if old_state != TaskState.RUNNING:
+                    self.archive()
+            return True
+
+    def archive(self) -> None:
+        """ Replace the task in the registry by a TaskRecord and release all references to other tasks """
+        with Task.lock:
+            Task.registry.archive(self)
+            self.dependencies = []
+            self.external_dependencies = set()
+            for link in self.input_links:
+                link.release()
+            self.input_links = []
+            # Artifacts nobody consumes can be removed right away
+            for name in [n for n in self.artifacts.keys() if self._artifact_consumers[n] == 0]:
+                self._remove_artifact(name)
+
+    def add_input(self, input: InputT) -> InputT:
+        """ Register an input of the task. Links are copied, so that they can be released once the task is archived """
+        if isinstance(input, ArtifactLink):
+            if input.task is None:
+                raise ValueError(f"Can not add the released {str(input)} as input")
+            link = type(input)(input.artifact_name, input.task)
+            link.acquire()
+            self.input_links.append(link)
+            return cast(InputT, link)
+        return input
 
     def set_group_name(self, name: str) -> None:
         if self.group is not None:
-            Task.groups[self.group] = name
+            with Task.lock:
+                Task.groups[self.group] = name
 
     def run(self) -> None:
         """ Called when a Task is executed """
         raise NotImplementedError(f"The given task does not implement a run() method")
     
     def try_abort(self) -> None:
-        if self.state in [TaskState.CREATED, TaskState.SCHEDULED, TaskState.WAITING]:
-            self.state = TaskState.ABORTED
+        """ Abort the task. A running task can only be aborted if it executes its workload in a WorkerProcess """
+        if self.set_state(TaskState.ABORTED, expected=[TaskState.CREATED, TaskState.SCHEDULED, TaskState.WAITING]):
             logger.info(f"Aborted task '{str(self)}'")
-        elif self.state == TaskState.RUNNING:
+            return
+        with Task.lock:
+            if self.process is not None and self.set_state(TaskState.ABORTED, expected=[TaskState.RUNNING]):
+                self.process.kill()
+                logger.info(f"Aborted running task '{str(self)}'")
+                return
+        if self.state == TaskState.RUNNING:
             logger.debug(f"Task '{str(self)}' is running and can not be aborted")
         else:
             logger.debug(f"Task '{str(self)}' has finished and can not be aborted")
+
+    @classmethod
+    def abort_group(cls, group: str|None) -> None:
+        """ Abort all tasks of the given group """
+        if group is None:
+            return
+        for t in Task.registry.by_group(group):
+            if not t.state.is_final:
+                t.try_abort()
+
+    def run_in_process(self, job: str, **kwargs) -> dict:
+        """ Execute a job of the worker_process module in a separate process, which is killed when the task is aborted """
+        process = WorkerProcess(job, **kwargs)
+        with Task.lock:
+            if self.state != TaskState.RUNNING:
+                raise TaskException(f"The task has been aborted")
+            self.process = process
+        try:
+            return process.run()
+        finally:
+            with Task.lock:
+                self.process = None
+
+    def add_dependency(self, task: "Task") -> None:
+        """ The task is not executed before the given task has finished. If the given task fails, this task is marked as DEPENDENCY_FAILED """
+        with Task.lock:
+            if self.state not in [TaskState.CREATED, TaskState.WAITING]:
+                logger.debug(f"Can not add dependency '{str(task)}' to task '{str(self)}' as it has already been scheduled")
+                return
+            self.dependencies.append(task)
+            if task.state == TaskState.FINISHED:
+                return
+            elif task.state.is_final:
+                self._dependency_failed(task)
+                return
+            self._pending_dependencies += 1
+            task.dependents.append(self)
     
     def add_external_dependency(self, name: str) -> None:
-        """ Call this function """
-        if self.state in [TaskState.CREATED, TaskState.SCHEDULED, TaskState.WAITING]:
-            self.external_dependencies.add(name)
-        elif self.state == TaskState.RUNNING:
+        """ Call this function to hold back the task until release_external_dependency() is called with the same name """
+        with Task.lock:
+            if self.state in [TaskState.CREATED, TaskState.WAITING]:
+                if name not in self.external_dependencies:
+                    self.external_dependencies.add(name)
+                    self._pending_dependencies += 1
+                return
+        if self.state == TaskState.RUNNING:
             logger.debug(f"Can not add external dependency '{name}' to task '{str(self)}' as the task is already running")
         else:
-            logger.debug(f"Can not add external dependency '{name}' to task '{str(self)}' as the task has already finished")
+            logger.debug(f"Can not add external dependency '{name}' to task '{str(self)}' as it has already been scheduled or finished")
 
     def release_external_dependency(self, name: str) -> None:
-        if name not in self.external_dependencies:
-            logger.debug(f"'{str(self)}': Trying to release a not existing external dependency")
-            return
-        self.external_dependencies.remove(name)
-        self.schedule()
+        with Task.lock:
+            if name not in self.external_dependencies:
+                logger.debug(f"'{str(self)}': Trying to release a not existing external dependency")
+                return
+            self.external_dependencies.remove(name)
+            self._dependency_resolved()
+
+    def schedule(self) -> None:
+        """ Schedule the task. It is queued as soon as all of its dependencies are resolved and waits otherwise """
+        with Task.lock:
+            if self.state != TaskState.CREATED:
+                return
+            if self._pending_dependencies > 0:
+                self.set_state(TaskState.WAITING)
+                return
+            self.set_state(TaskState.SCHEDULED)
+            lanes[self.resource_class].put(self)
+
+    def _dependency_resolved(self) -> None:
+        """ Called when a dependency has finished. Queues the task with priority if it was the last one """
+        with Task.lock:
+            self._pending_dependencies -= 1
+            if self._pending_dependencies > 0:
+                return
+            if self.set_state(TaskState.SCHEDULED, expected=[TaskState.WAITING]):
+                lanes[self.resource_class].put(self, priority=True)
+                logger.debug(f"Task '{str(self)}' was moved from WAITING to SCHEDULED")
+
+    def _dependency_failed(self, task: "Task") -> None:
+        if self.set_state(TaskState.DEPENDENCY_FAILED, expected=[TaskState.CREATED, TaskState.SCHEDULED, TaskState.WAITING]):
+            logger.debug(f"Task '{str(self)}' was marked as DEPENDENCY_FAILED as '{str(task)}' did not finish")
+
+    def _resolve_dependents(self) -> None:
+        """ Notify the dependent tasks that this task has reached a final state """
+        with Task.lock:
+            dependents, self.dependents = self.dependents, []
+            for d in dependents:
+                if self.state == TaskState.FINISHED:
+                    d._dependency_resolved()
+                else:
+                    d._dependency_failed(self)
 
     def clean_up(self) -> None:
         """ Clean up the artifacts and release their resources """
@@ -213,11 +602,25 @@ class Task:
             del a
         self.artifacts = {}
 
-    def schedule(self) -> None:
-        if self.state not in [TaskState.CREATED, TaskState.SCHEDULED, TaskState.WAITING]:
-            return
-        self.state = TaskState.SCHEDULED
-        task_queue.put(self)
+    def acquire_artifact(self, name: str) -> None:
+        """ Register a consumer of the given artifact """
+        with Task.lock:
+            self._artifact_consumers[name] += 1
+
+    def release_artifact(self, name: str) -> None:
+        """ Unregister a consumer of the given artifact. The artifact is removed when it was the last consumer and the task has finished """
+        with Task.lock:
+            self._artifact_consumers[name] -= 1
+            if self._artifact_consumers[name] > 0 or not self.state.is_final:
+                return
+            self._remove_artifact(name)
+
+    def _remove_artifact(self, name: str) -> None:
+        with Task.lock:
+            artifact = self.artifacts.pop(name, None)
+        if artifact is not None:
+            logger.debug(f"Removing artifact '{name}' of task '{str(self)}' as it has no consumers left")
+            artifact.cleanup()
 
     def register_artifact(self, artifact: Artifact) -> Artifact:
         """ Store an artifact to be used in other dependend tasks """
@@ -230,6 +633,10 @@ class Task:
             return None
         return self.t_end - self.t_start
     
+    @property
+    def error_message(self) -> str|None:
+        return self.error.message if self.error is not None else None
+    
     @property
     def name(self) -> str:
         return "Generic Task"
@@ -255,11 +662,94 @@ class TaskException(Exception):
         super().__init__(*args)
         self.message = message
 
+class WorkerProcess:
+    """
+    Runs a job defined in the worker_process module in a separate python process. In contrast to a thread, the process
+    (including all its child processes like Tesseract) can be killed at any time to release its resources
+    """
+
+    script_path = Path(worker_process.__file__)
+    running: set["WorkerProcess"] = set()
+    _lock = threading.Lock()
+
+    def __init__(self, job: str, **kwargs) -> None:
+        self.job = job
+        self.kwargs = kwargs
+        self.killed = False
+        self._popen: subprocess.Popen|None = None
+
+    def run(self) -> dict:
+        """ Run the job and return its result. Raises a TaskException if the job failed or the process was killed """
+        with WorkerProcess._lock:
+            if self.killed:
+                raise TaskException(f"The task has been aborted")
+            self._popen = subprocess.Popen([sys.executable, str(WorkerProcess.script_path)], 
+                                           stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
+                                           text=True, start_new_session=True)
+            WorkerProcess.running.add(self)
+        logger.debug(f"Started worker process {self._popen.pid} for job '{self.job}'")
+        try:
+            stdout, stderr = self._popen.communicate(json.dumps({"name": self.job, "kwargs": self.kwargs}))
+        finally:
+            with WorkerProcess._lock:
+                WorkerProcess.running.discard(self)
+        self._forward_logs(stderr)
+
+        if self.killed:
+            raise TaskException(f"The task has been aborted")
+        lines = [l for l in stdout.splitlines() if l.strip() != ""]
+        try:
+            response = json.loads(lines[-1])
+        except (IndexError, json.JSONDecodeError):
+            raise TaskException(f"The worker process terminated unexpectedly (exit code {self._popen.returncode})")
+        if "traceback" in response:
+            raise RuntimeError(f"Job '{self.job}' failed in worker process:\n{response['traceback']}")
+        if "error" in response:
+            raise TaskException(response["error"])
+        return response["result"]
+
+    def kill(self) -> None:
+        """ Kill the process and all of its child processes """
+        with WorkerProcess._lock:
+            self.killed = True
+            if self._popen is None or self._popen.poll() is not None:
+                return
+            try:
+                if hasattr(os, "killpg"):
+                    os.killpg(self._popen.pid, signal.SIGKILL)
+                else:
+                    self._popen.kill()
+            except OSError:
+                logger.warning(f"Failed to kill worker process {self._popen.pid}", exc_info=True)
+            else:
+                logger.debug(f"Killed worker process {self._popen.pid}")
+
+    @classmethod
+    def kill_all(cls) -> None:
+        with WorkerProcess._lock:
+            processes = list(WorkerProcess.running)
+        for p in processes:
+            p.kill()
+
+    def _forward_logs(self, stderr: str) -> None:
+        level = logging.DEBUG
+        for line in stderr.splitlines():
+            level_name, sep, msg = line.partition("|")
+            if sep and isinstance(logging.getLevelName(level_name), int):
+                level = logging.getLevelName(level_name)
+            else:
+                msg = line
+            ocrmypdf_logger.log(level, msg)
+
+atexit.register(WorkerProcess.kill_all)
+
 class WaitForFileTask(Task):
     """
     Wait for a file before proceding
     """
 
+    resource_class = ResourceClass.INSTANT
+
     def __init__(self, 
                  display_name: str,
                  display_desc: str,
@@ -283,7 +773,8 @@ class WaitForFileTask(Task):
         self.artifacts["file"] = val
     
     def run(self):
-        pass
+        if self.file_artifact.path.exists():
+            self.file_size = self.file_artifact.path.stat().st_size
 
     def __str__(self) -> str:
         return f"WaitForFileTask '{self.name}'"
@@ -301,6 +792,11 @@ class UploadToFTPTask(Task):
     Upload an file to an external FTP server
     """
 
+    resource_class = ResourceClass.IO
+    # Interrupted uploads are resumed from the size of the partial file on the server
+    max_attempts = 3
+    retry_delay = 2
+
     def __init__(self, 
                  input: Path|FileArtifactLink, 
                  file_name: str,
@@ -311,7 +807,7 @@ class UploadToFTPTask(Task):
                  group: str|None = None, 
                  hidden: bool = False) -> None:
         super().__init__(group=group, hidden=hidden)
-        self.input = input
+        self.input = self.add_input(input)
         self.file_name = file_name
         self.address = address
         self.username = username
@@ -322,35 +818,34 @@ class UploadToFTPTask(Task):
         logger.debug(f"Created UploadToFTPTask '{str(self)}'")
 
     def run(self) -> None:
-        if self.tls:
-            ftp = ftplib.FTP_TLS()
-        else:
-            ftp = ftplib.FTP()
+        path = self.input.get().path if isinstance(self.input, FileArtifactLink) else self.input
+        if not path.exists():
+            raise TaskException(f"Missing input file '{self.input}'")
+        self.file_size = path.stat().st_size
+
         try:
-            ftp.connect(self.address[0], self.address[1], timeout=30)
-            if isinstance(ftp, ftplib.FTP_TLS):
-                ftp.auth()
-                ftp.prot_p()
-            ftp.login(user=self.username, passwd=self.password)
-            ftp.cwd(self.folder)
-            logger.debug(f"Connected to upload FTP server ('{ftp.getwelcome()}')")
-            files = ftp.nlst()
-
-            if self.file_name in files:
-                raise TaskException(f"File already present on the server")
-            
-            path = self.input.get().path if isinstance(self.input, FileArtifactLink) else self.input
-            if not path.exists():
-                raise TaskException(f"Missing input file '{self.input}'")
-            
-            with open(path, "rb") as f:
-                ftp.storbinary(f"STOR {self.file_name}", f)
+            for attempt in itertools.count(1):
+                try:
+                    with export_pool.connection(self.address, self.username, self.password, self.folder, self.tls) as ftp:
+                        if attempt == 1 and remote_file_exists(ftp, self.file_name):
+                            raise TaskException(f"File already present on the server")
+                        upload_file(ftp, path, self.file_name, resume=(attempt > 1))
+                    break
+                except (OSError, EOFError, ftplib.error_temp) as ex:
+                    if attempt >= UploadToFTPTask.max_attempts:
+                        raise
+                    logger.info(f"Upload of '{self.file_name}' was interrupted ({str(ex)}). Resuming in {UploadToFTPTask.retry_delay*attempt} s")
+                    time.sleep(UploadToFTPTask.retry_delay*attempt)
 
             logger.info(f"Uploaded file '{self.file_name}' to the remote FTP server")
+        except (OSError, EOFError, ftplib.error_temp) as ex:
+            # The server is not reachable: Keep the file for a later upload
+            if export_spool is None:
+                raise TaskException(f"Failed to upload the file: {str(ex)}")
+            export_spool.add(path, self.file_name, self.address, self.username, self.password, self.folder, self.tls)
+            raise TaskException(f"Export server not reachable ({str(ex)}). The file has been spooled for a later upload")
         except ftplib.all_errors as ex:
             raise TaskException(f"Failed to upload the file: {str(ex)}")
-        finally:
-            ftp.close()    
 
     @property
     def name(self) -> str:
@@ -364,14 +859,114 @@ class UploadToFTPTask(Task):
     def __str__(self) -> str:
         return f"Upload '{self.file_name}'"
 
+class ExportToDirectoryTask(Task):
+    """
+    Export a file into a local or mounted directory. The file is hardlinked if possible and only copied as a fallback. It is
+    never moved, as other tasks may still attach to the artifact until the producer is archived
+    """
+
+    resource_class = ResourceClass.IO
+
+    def __init__(self, 
+                 input: Path|FileArtifactLink, 
+                 file_name: str,
+                 directory: Path,
+                 group: str|None = None, 
+                 hidden: bool = False) -> None:
+        super().__init__(group=group, hidden=hidden)
+        self.input = self.add_input(input)
+        self.file_name = file_name
+        self.directory = directory
+
+        logger.debug(f"Created ExportToDirectoryTask '{str(self)}'")
+
+    def run(self) -> None:
+        path = self.input.get().path if isinstance(self.input, FileArtifactLink) else self.input
+        if not path.exists():
+            raise TaskException(f"Missing input file '{self.input}'")
+        if not self.directory.is_dir():
+            raise TaskException(f"The export directory '{self.directory}' does not exist")
+        self.file_size = path.stat().st_size
+
+        target = self.directory / self.file_name
+        if target.exists():
+            raise TaskException(f"File already present in the export directory")
+        
+        try:
+            os.link(path, target)
+            logger.debug(f"Hardlinked '{self.file_name}' into the export directory")
+        except FileExistsError:
+            raise TaskException(f"File already present in the export directory")
+        except OSError:
+            # For example if the export directory is located on another file system
+            temp_path = self.directory / f"{self.file_name}.part"
+            try:
+                shutil.copyfile(path, temp_path)
+                os.replace(temp_path, target)
+            except OSError as ex:
+                temp_path.unlink(missing_ok=True)
+                raise TaskException(f"Failed to export the file: {str(ex)}")
+            logger.debug(f"Copied '{self.file_name}' into the export directory")
+
+        try:
+            # Artifacts are only readable by the owner
+            os.chmod(target, 0o666 & ~_umask)
+        except OSError:
+            logger.warning(f"Failed to set the permissions of the exported file '{self.file_name}'")
+        logger.info(f"Exported file '{self.file_name}' to '{self.directory}'")
+
+    @property
+    def name(self) -> str:
+        return "Export to directory"
+    
+    @property
+    def desc(self) -> str:
+        return str(self.directory)
+
+    def __str__(self) -> str:
+        return f"Export '{self.file_name}'"
+
+class OutputPreset(NamedTuple):
+    """ Defines how exported files are encoded """
+    linearize: bool
+    object_stream_mode: pikepdf.ObjectStreamMode
+    recompress_flate: bool
+    # Output type passed to OCRmyPDF (e.g. 'pdf' or 'pdfa'). None for the default of OCRmyPDF
+    ocr_output_type: str|None
+
+    @property
+    def save_kwargs(self) -> dict:
+        """ The arguments for pikepdf.Pdf.save() """
+        return dict(linearize=self.linearize, 
+                    object_stream_mode=self.object_stream_mode, 
+                    recompress_flate=self.recompress_flate, 
+                    preserve_pdfa=True)
+
+output_presets: dict[str, OutputPreset] = {
+    "default": OutputPreset(linearize=True, object_stream_mode=pikepdf.ObjectStreamMode.preserve, recompress_flate=False, ocr_output_type=None),
+    "fast": OutputPreset(linearize=False, object_stream_mode=pikepdf.ObjectStreamMode.preserve, recompress_flate=False, ocr_output_type="pdf"),
+    "small": OutputPreset(linearize=False, object_stream_mode=pikepdf.ObjectStreamMode.generate, recompress_flate=True, ocr_output_type="pdf"),
+    "archival": OutputPreset(linearize=True, object_stream_mode=pikepdf.ObjectStreamMode.generate, recompress_flate=True, ocr_output_type="pdfa"),
+}
+
+
 class PDFTask(Task):
     """ Process a given PDF file """
 
-    def __init__(self, input: Path|FileArtifactLink, file_name: str, group: str|None = None, hidden: bool = False) -> None:
+    resource_class = ResourceClass.CPU_LIGHT
+
+    def __init__(self, 
+                 input: Path|FileArtifactLink, 
+                 file_name: str, 
+                 remove_pages: PageSetArtifactLink|None = None, 
+                 preset: OutputPreset = output_presets["default"],
+                 group: str|None = None, 
+                 hidden: bool = False) -> None:
         super().__init__(group=group, hidden=hidden)
-        self.input = input
+        self.input = self.add_input(input)
+        self.remove_pages = self.add_input(remove_pages)
         self.file_name = file_name
-        self.num_pages: int|None = None
+        self.preset = preset
 
         self.register_artifact(FileArtifact(self, "export"))
         self.export_artifact_link = FileArtifactLink("export", self)
@@ -388,18 +983,34 @@ class PDFTask(Task):
         if not path.exists():
             raise TaskException(f"Missing input file '{self.input}'")
 
+        remove_pages = self.remove_pages.get().pages if self.remove_pages is not None else []
+        self.num_pages = PDFTask.finalize_pdf(path, self.export_artifact.path, self.file_name, remove_pages, self.preset)
+        self.file_size = self.export_artifact.path.stat().st_size
+
+    @staticmethod
+    def finalize_pdf(path: Path, 
+                     output_path: Path, 
+                     file_name: str, 
+                     remove_pages: list[int]|None = None, 
+                     preset: OutputPreset = output_presets["default"]) -> int:
+        """ Remove the given pages, set the producer and save the PDF with the given output preset. Returns the page count """
         try:
             with pikepdf.open(path) as pdf:
-                self.num_pages = len(pdf.pages)
-                with pdf.open_metadata() as metadata:
-                    metadata["Producer"] = "pyPDFserver"
-                pdf.save(self.export_artifact.path, linearize=True, preserve_pdfa=True)
-
+                if remove_pages is not None and len(remove_pages) > 0:
+                    if len(remove_pages) >= len(pdf.pages):
+                        raise TaskException(f"Discarded '{file_name}' as all pages are blank")
+                    for i in sorted(remove_pages, reverse=True):
+                        del pdf.pages[i]
+                    logger.debug(f"Removed {len(remove_pages)} blank pages from '{file_name}'")
+                with pdf.open_metadata(set_pikepdf_as_editor=False) as metadata:
+                    metadata["pdf:Producer"] = "pyPDFserver"
+                pdf.save(output_path, **preset.save_kwargs)
+                return len(pdf.pages)
         except (pikepdf.PdfError, pikepdf.PasswordError, pikepdf.DataDecodingError) as ex:
-            raise TaskException(f"Failed to process '{self.file_name}': {str(ex)}")
+            raise TaskException(f"Failed to process '{file_name}': {str(ex)}")
         except ValueError as ex:
-            logger.error(f"Failed to process '{self.file_name}': ", exc_info=True)
-            raise TaskException(f"Failed to process '{self.file_name}': {str(ex)}")
+            logger.error(f"Failed to process '{file_name}': ", exc_info=True)
+            raise TaskException(f"Failed to process '{file_name}': {str(ex)}")
 
     def __str__(self) -> str:
         return f"Decode PDF '{self.file_name}'"
@@ -415,6 +1026,8 @@ class PDFTask(Task):
 
 class OCRTask(Task):
 
+    resource_class = ResourceClass.CPU_HEAVY
+
     def __init__(self, input: Path|FileArtifactLink, 
                  file_name: str, 
                  language: str, 
@@ -426,10 +1039,19 @@ class OCRTask(Task):
                  color_conversion_strategy: str|None,
                  num_jobs: int|None = None, 
                  tesseract_timeout: int|None = 60,
+                 skip_pages: PageSetArtifactLink|None = None,
+                 page_range: tuple[int, int]|None = None,
+                 finalize: bool = False,
+                 preset: OutputPreset = output_presets["default"],
                  group: str|None = None, 
                  hidden: bool = False) -> None:
         super().__init__(group=group, hidden=hidden)
-        self.input = input
+        self.input = self.add_input(input)
+        self.skip_pages = self.add_input(skip_pages)
+        self.page_range = page_range
+        # If set, the task also writes the final file (see PDFTask.finalize_pdf) and no PDFTask is needed afterwards
+        self.finalize = finalize
+        self.preset = preset
         self.file_name = file_name
         self.language = language
         self.deskew = deskew
@@ -443,6 +1065,9 @@ class OCRTask(Task):
 
         self.file_size_before: int|None = None
         self.file_size_after: int|None = None
+        self.cached = False
+        # Pages (starting at 1) passed to OCRmyPDF. None for all pages
+        self.pages: list[int]|None = None
 
         self.register_artifact(FileArtifact(self, "export"))
         self.export_artifact_link = FileArtifactLink("export", self)
@@ -459,26 +1084,89 @@ class OCRTask(Task):
         
         self.file_size_before = path.stat().st_size
 
+        # Pages already containing text (e.g. born-digital documents) and blank pages are not passed to OCRmyPDF
         try:
-            exit_code = ocrmypdf.ocr(path, self.export_artifact.path, 
-                                        language=self.language,
-                                        deskew=self.deskew,
-                                        rotate_pages=self.rotate_pages,
-                                        jobs=self.num_jobs,
-                                        optimize=self.optimize,
-                                        color_conversion_strategy=self.color_conversion_strategy,
-                                        tesseract_timeout=self.tesseract_timeout,
-                                        jpg_quality=self.jpg_quality,
-                                        png_quality=self.png_quality,
-                                        skip_text=True,
-                                        progress_bar=False,
-                                        )
-        except ocrmypdf.exceptions.ExitCodeException as ex:
-            raise TaskException(str(ex))
-        if not exit_code == ocrmypdf.ExitCode.ok:
-            raise TaskException(exit_code.name)
+            num_pages, text_pages = find_text_pages(path)
+        except (pikepdf.PdfError, pikepdf.PasswordError, ValueError):
+            # Leave the error handling to OCRmyPDF
+            num_pages, text_pages = None, []
+        skipped_pages = set(text_pages)
+        if self.skip_pages is not None:
+            start = self.page_range[0] if self.page_range is not None else 0
+            skipped_pages.update([i - start for i in self.skip_pages.get().pages])
+        if num_pages is not None:
+            self.num_pages = num_pages
+            self.pages = [i + 1 for i in range(num_pages) if i not in skipped_pages]
+            if len(self.pages) == 0:
+                if self.finalize:
+                    PDFTask.finalize_pdf(path, self.export_artifact.path, self.file_name, preset=self.preset)
+                else:
+                    shutil.copyfile(path, self.export_artifact.path)
+                self.file_size = self.file_size_after = self.export_artifact.path.stat().st_size
+                logger.info(f"Skipped OCR for '{self.file_name}' as all pages already contain text or are blank")
+                return
+            elif len(self.pages) == num_pages:
+                self.pages = None
+
+        # The final file is written by PDFTask.finalize_pdf in the same task, so OCRmyPDF writes an intermediate file
+        ocr_path = self.export_artifact.path.with_name(f"{self.export_artifact.path.name}.ocr") if self.finalize else self.export_artifact.path
+        try:
+            self._ocr(path, ocr_path)
+            if self.finalize:
+                PDFTask.finalize_pdf(ocr_path, self.export_artifact.path, self.file_name, preset=self.preset)
+        finally:
+            if self.finalize:
+                ocr_path.unlink(missing_ok=True)
         self.file_size_after = self.export_artifact.path.stat().st_size
+        self.file_size = self.file_size_after
+
+    def _ocr(self, path: Path, output_path: Path) -> None:
+        """ Apply OCR on the file or reuse a cached result """
+        cache_key = None
+        if ocr_cache is not None:
+            input_hash = self.input.get().sha256 if isinstance(self.input, FileArtifactLink) else None
+            if input_hash is None:
+                input_hash = file_sha256(path)
+            cache_key = ocr_cache.key(input_hash, self.ocr_params)
+            if ocr_cache.get(cache_key, output_path):
+                self.cached = True
+                logger.info(f"Reused the cached OCR result for '{self.file_name}'")
+                return
+
+        kwargs = dict(input_path=str(path),
+                      output_path=str(output_path),
+                      jobs=self.num_jobs,
+                      progress_bar=False,
+                      **self.ocr_params
+                      )
+        if ocr_in_worker_process:
+            self.run_in_process("ocr", **kwargs)
+        else:
+            try:
+                worker_process.ocr(**kwargs)
+            except worker_process.JobError as ex:
+                raise TaskException(ex.message)
         logger.debug(f"Applied OCR for '{self.file_name}' ({self.param_str})")
+        if ocr_cache is not None and cache_key is not None:
+            ocr_cache.put(cache_key, output_path)
+
+    @property
+    def ocr_params(self) -> dict:
+        """ The parameters passed to OCRmyPDF which affect the result """
+        return dict(language=self.language,
+                    deskew=self.deskew,
+                    rotate_pages=self.rotate_pages,
+                    optimize=self.optimize,
+                    color_conversion_strategy=self.color_conversion_strategy,
+                    tesseract_timeout=self.tesseract_timeout,
+                    jpg_quality=self.jpg_quality,
+                    png_quality=self.png_quality,
+                    skip_text=True,
+                    pages=(",".join([str(p) for p in self.pages]) if self.pages is not None else None),
+                    output_type=self.preset.ocr_output_type,
+                    # The final file is written by pikepdf with the output preset
+                    fast_web_view=999999,
+                    )
         
     @property
     def name(self) -> str:
@@ -499,6 +1187,10 @@ class OCRTask(Task):
             s += f", color_conversion_strategy={self.color_conversion_strategy}"
         if self.file_size_before is not None and self.file_size_after is not None:
             s += f", {self.file_size_before/(1024**2):>0.3}MB -> {self.file_size_after/(1024**2):>0.3}MB"
+        if self.pages is not None:
+            s += f", OCR on {len(self.pages)} of {self.num_pages} pages"
+        if self.cached:
+            s += ", cached"
         return s
 
     def __repr__(self) -> str:
@@ -510,17 +1202,25 @@ class OCRTask(Task):
         
 class DuplexTask(Task):
 
+    resource_class = ResourceClass.CPU_LIGHT
+
     def __init__(self, 
                  input1: Path|FileArtifactLink, 
                  input2: Path|FileArtifactLink, 
                  file1_name: str, 
                  file2_name: str, 
                  export_name: str,
+                 remove_pages1: PageSetArtifactLink|None = None,
+                 remove_pages2: PageSetArtifactLink|None = None,
+                 preset: OutputPreset = output_presets["default"],
                  group: str|None = None, 
                  hidden: bool = False) -> None:
         super().__init__(group=group, hidden=hidden)
-        self.input1 = input1
-        self.input2 = input2
+        self.input1 = self.add_input(input1)
+        self.input2 = self.add_input(input2)
+        self.remove_pages1 = self.add_input(remove_pages1)
+        self.remove_pages2 = self.add_input(remove_pages2)
+        self.preset = preset
         self.file1_name = file1_name
         self.file2_name = file2_name
         self.export_name = export_name
@@ -553,17 +1253,37 @@ class DuplexTask(Task):
                 if num_pages1 != num_pages2:
                     raise TaskException(f"Rejected to merge PDFs with unequal page count ({num_pages1} and {num_pages2})")
                 
-                for p1, p2 in zip(pdf1.pages[:], pdf2.pages[::-1]):
-                    pdf_merged.pages.append(p1)
-                    pdf_merged.pages.append(p2)
-
-                with pdf_merged.open_metadata() as meta:
+                remove_pages1 = set(self.remove_pages1.get().pages) if self.remove_pages1 is not None else set()
+                # The back pages are in reversed order
+                remove_pages2 = set([num_pages2 - 1 - i for i in self.remove_pages2.get().pages]) if self.remove_pages2 is not None else set()
+                if len(remove_pages1) + len(remove_pages2) >= num_pages1 + num_pages2:
+                    raise TaskException(f"Discarded '{self.export_name}' as all pages are blank")
+                
+                for i, (p1, p2) in enumerate(zip(pdf1.pages[:], pdf2.pages[::-1])):
+                    if i not in remove_pages1:
+                        pdf_merged.pages.append(p1)
+                    if i not in remove_pages2:
+                        pdf_merged.pages.append(p2)
+                if len(remove_pages1) + len(remove_pages2) > 0:
+                    logger.debug(f"Removed {len(remove_pages1) + len(remove_pages2)} blank pages from '{self.export_name}'")
+
+                # Both halves carry their own copies of shared resources (e.g. the fonts added by OCR)
+                if (num_removed := deduplicate_resources(pdf_merged)) > 0:
+                    logger.debug(f"Removed {num_removed} duplicate objects from '{self.export_name}'")
+
+                # Keep the PDF/A conformance of the halves written by OCRmyPDF (e.g. for the archival preset)
+                if pdf1.open_metadata().pdfa_status == pdf2.open_metadata().pdfa_status:
+                    copy_pdfa_identification(pdf1, pdf_merged)
+
+                with pdf_merged.open_metadata(set_pikepdf_as_editor=False) as meta:
                     # with pdf1.open_metadata() as meta1, pdf2.open_metadata() as meta2:
                     #     meta.update(meta2)
                     #     meta.update(meta1)
-                    meta["Producer"] = "pyPDFserver"
+                    meta["pdf:Producer"] = "pyPDFserver"
 
-                pdf_merged.save(self.export_artifact.path, preserve_pdfa=True, linearize=True)
+                pdf_merged.save(self.export_artifact.path, **self.preset.save_kwargs)
+                self.num_pages = len(pdf_merged.pages)
+            self.file_size = self.export_artifact.path.stat().st_size
         except (pikepdf.PdfError, pikepdf.PasswordError, pikepdf.DataDecodingError) as ex:
             raise TaskException(f"Failed to process '{self.export_name}': {str(ex)}")
         except ValueError as ex:
@@ -583,15 +1303,338 @@ class DuplexTask(Task):
         return f"Create duplex pdf '{self.export_name}'"
 
 
-task_queue: Queue[Task] = Queue()
-task_priority_queue: Queue[Task] = Queue()
-current_task: Task|None = None
+class DetectBlankPagesTask(Task):
+    """ Detect blank pages by rendering the pages in low resolution and measuring their ink coverage """
+
+    resource_class = ResourceClass.CPU_LIGHT
+
+    def __init__(self, 
+                 input: Path|FileArtifactLink, 
+                 file_name: str, 
+                 threshold: float,
+                 group: str|None = None, 
+                 hidden: bool = False) -> None:
+        super().__init__(group=group, hidden=hidden)
+        self.input = self.add_input(input)
+        self.file_name = file_name
+        self.threshold = threshold
+        self.num_blank_pages: int|None = None
+
+        self.register_artifact(PageSetArtifact(self, "blank_pages"))
+        self.blank_pages_link = PageSetArtifactLink("blank_pages", self)
+
+        logger.debug(f"Created DetectBlankPagesTask '{str(self)}'")
+
+    @property
+    def blank_pages(self) -> PageSetArtifact:
+        return cast(PageSetArtifact, self.artifacts["blank_pages"])
+
+    def run(self) -> None:
+        path = self.input.get().path if isinstance(self.input, FileArtifactLink) else self.input
+        if not path.exists():
+            raise TaskException(f"Missing input file '{self.input}'")
+        
+        try:
+            num_pages, blank_pages = find_blank_pages(path, self.threshold)
+        except pypdfium2.PdfiumError as ex:
+            raise TaskException(f"Failed to render '{self.file_name}': {str(ex)}")
+        self.blank_pages.pages = blank_pages
+        self.blank_pages.num_pages = self.num_pages = num_pages
+        self.num_blank_pages = len(blank_pages)
+        logger.debug(f"Detected {len(blank_pages)} blank pages in '{self.file_name}'")
+
+    @property
+    def name(self) -> str:
+        return "Detect blank pages"
+    
+    @property
+    def desc(self) -> str:
+        if self.num_blank_pages is None:
+            return ""
+        return f"{self.num_blank_pages} of {self.num_pages} pages blank"
+        
+    def __str__(self) -> str:
+        return f"Detect blank pages in '{self.file_name}'"
+
+
+class SplitPDFTask(Task):
+    """ Split a PDF into shards of consecutive pages (for example to apply OCR on them in parallel) """
+
+    resource_class = ResourceClass.CPU_LIGHT
+
+    def __init__(self, 
+                 input: Path|FileArtifactLink, 
+                 file_name: str, 
+                 page_ranges: list[tuple[int, int]],
+                 group: str|None = None, 
+                 hidden: bool = False) -> None:
+        super().__init__(group=group, hidden=hidden)
+        self.input = self.add_input(input)
+        self.file_name = file_name
+        self.page_ranges = page_ranges
+
+        self.shard_artifact_links: list[FileArtifactLink] = []
+        for i in range(len(page_ranges)):
+            self.register_artifact(FileArtifact(self, f"shard_{i}"))
+            self.shard_artifact_links.append(FileArtifactLink(f"shard_{i}", self))
+
+        logger.debug(f"Created SplitPDFTask '{str(self)}'")
+
+    @staticmethod
+    def get_page_ranges(num_pages: int, shard_size: int) -> list[tuple[int, int]]:
+        """ Returns the page ranges (start inclusive, end exclusive) to split a document into shards of the given size """
+        return [(i, min(i + shard_size, num_pages)) for i in range(0, num_pages, shard_size)]
+
+    def run(self) -> None:
+        path = self.input.get().path if isinstance(self.input, FileArtifactLink) else self.input
+        if not path.exists():
+            raise TaskException(f"Missing input file '{self.input}'")
+        
+        try:
+            with pikepdf.open(path) as pdf:
+                num_pages = self.num_pages = len(pdf.pages)
+                if num_pages != self.page_ranges[-1][1]:
+                    raise TaskException(f"Expected {self.page_ranges[-1][1]} pages, but the document has {num_pages} pages")
+                for (start, end), link in zip(self.page_ranges, self.shard_artifact_links):
+                    with pikepdf.Pdf.new() as shard:
+                        shard.pages.extend(pdf.pages[start:end])
+                        shard.save(link.get().path)
+        except (pikepdf.PdfError, pikepdf.PasswordError, pikepdf.DataDecodingError) as ex:
+            raise TaskException(f"Failed to split '{self.file_name}': {str(ex)}")
+        except ValueError as ex:
+            logger.error(f"Failed to split '{self.file_name}': ", exc_info=True)
+            raise TaskException(f"Failed to split '{self.file_name}': {str(ex)}")
+        logger.debug(f"Split '{self.file_name}' into {len(self.page_ranges)} shards")
+
+    @property
+    def name(self) -> str:
+        return "Split PDF"
+    
+    @property
+    def desc(self) -> str:
+        return f"{len(self.page_ranges)} shards"
+        
+    def __str__(self) -> str:
+        return f"Split pdf '{self.file_name}'"
+
+
+class MergePDFTask(Task):
+    """ Concatenate PDFs in the given order. The document metadata is copied from the metadata input (e.g. the unsplit document) """
+
+    resource_class = ResourceClass.CPU_LIGHT
+
+    def __init__(self, 
+                 inputs: list[Path|FileArtifactLink], 
+                 metadata_input: Path|FileArtifactLink|None,
+                 file_name: str, 
+                 group: str|None = None, 
+                 hidden: bool = False) -> None:
+        super().__init__(group=group, hidden=hidden)
+        self.inputs = [self.add_input(i) for i in inputs]
+        self.metadata_input = self.add_input(metadata_input)
+        self.file_name = file_name
+
+        self.register_artifact(FileArtifact(self, "export"))
+        self.export_artifact_link = FileArtifactLink("export", self)
 
-def _pdfworker_handler() -> None:
-    global worker_thread
-    logger.debug(f"Started the pdf server (thread {worker_thread.native_id})")
+        logger.debug(f"Created MergePDFTask '{str(self)}'")
+
+    @property
+    def export_artifact(self) -> FileArtifact:
+        return cast(FileArtifact, self.artifacts["export"])
+
+    def run(self) -> None:
+        paths = [i.get().path if isinstance(i, FileArtifactLink) else i for i in self.inputs]
+        for i, p in zip(self.inputs, paths):
+            if not p.exists():
+                raise TaskException(f"Missing input file '{i}'")
+        metadata_path = None
+        if self.metadata_input is not None:
+            metadata_path = self.metadata_input.get().path if isinstance(self.metadata_input, FileArtifactLink) else self.metadata_input
+            if not metadata_path.exists():
+                raise TaskException(f"Missing input file '{self.metadata_input}'")
+
+        try:
+            with pikepdf.Pdf.new() as pdf_merged:
+                for p in paths:
+                    with pikepdf.open(p) as pdf:
+                        pdf_merged.pages.extend(pdf.pages)
+
+                if metadata_path is not None:
+                    with pikepdf.open(metadata_path) as pdf_meta:
+                        if "/Info" in pdf_meta.trailer:
+                            pdf_merged.docinfo = pdf_merged.copy_foreign(pdf_meta.docinfo)
+                        if "/Metadata" in pdf_meta.Root:
+                            pdf_merged.Root.Metadata = pdf_merged.copy_foreign(pdf_meta.Root.Metadata)
+
+                # OCRmyPDF writes PDF/A by default, so keep the conformance of the shards
+                if len(paths) > 0:
+                    with pikepdf.open(paths[0]) as pdf_first:
+                        copy_pdfa_identification(pdf_first, pdf_merged)
+
+                if (num_removed := deduplicate_resources(pdf_merged)) > 0:
+                    logger.debug(f"Removed {num_removed} duplicate objects from '{self.file_name}'")
+
+                with pdf_merged.open_metadata(set_pikepdf_as_editor=False) as meta:
+                    meta["pdf:Producer"] = "pyPDFserver"
+
+                pdf_merged.save(self.export_artifact.path)
+                self.num_pages = len(pdf_merged.pages)
+            self.file_size = self.export_artifact.path.stat().st_size
+        except (pikepdf.PdfError, pikepdf.PasswordError, pikepdf.DataDecodingError) as ex:
+            raise TaskException(f"Failed to merge '{self.file_name}': {str(ex)}")
+        except ValueError as ex:
+            logger.error(f"Failed to merge '{self.file_name}': ", exc_info=True)
+            raise TaskException(f"Failed to merge '{self.file_name}': {str(ex)}")
+
+    @property
+    def name(self) -> str:
+        return "Merge PDF"
+    
+    @property
+    def desc(self) -> str:
+        return f"{len(self.inputs)} parts"
+        
+    def __str__(self) -> str:
+        return f"Merge pdf '{self.file_name}'"
+
+
+def get_page_count(path: Path) -> int|None:
+    """ Read the page count of a PDF without decoding its content. Returns None if the file can not be opened """
+    try:
+        with pikepdf.open(path) as pdf:
+            return len(pdf.pages)
+    except (pikepdf.PdfError, pikepdf.PasswordError, ValueError):
+        return None
+
+# Dictionaries of these types are deduplicated in addition to all streams (e.g. font files, ICC profiles and XObjects)
+_dedup_types = [pikepdf.Name.Font, pikepdf.Name.FontDescriptor, pikepdf.Name.ExtGState, pikepdf.Name.XObject]
+
+def _dedup_key(obj: pikepdf.Object, data_hashes: dict[tuple[int, int], bytes]) -> bytes|None:
+    """ 
+    Returns the content hash of a deduplication candidate or None for other objects. The hashes of the stream data are
+    cached in the given dict, as only the stream dictionaries change when references are replaced
+    """
+    if isinstance(obj, pikepdf.Stream):
+        if obj.objgen not in data_hashes:
+            data_hashes[obj.objgen] = hashlib.sha256(obj.read_raw_bytes()).digest()
+        stream_dict = pikepdf.Dictionary({k: v for k, v in obj.stream_dict.items() if k != "/Length"})
+        return hashlib.sha256(b"stream" + stream_dict.unparse(resolved=True) + data_hashes[obj.objgen]).digest()
+    elif isinstance(obj, pikepdf.Dictionary) and obj.get("/Type", None) in _dedup_types:
+        return hashlib.sha256(b"dict" + obj.unparse(resolved=True)).digest()
+    return None
+
+def _replace_references(obj: pikepdf.Object, replace: dict[tuple[int, int], pikepdf.Object]) -> bool:
+    """ Replace references in the given object and its direct children. Returns True if any reference was replaced """
+    if isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream)):
+        items = [(k, obj[k]) for k in obj.keys()]
+    elif isinstance(obj, pikepdf.Array):
+        items = list(enumerate(obj))
+    else:
+        return False
+    changed = False
+    for k, v in items:
+        if not isinstance(v, pikepdf.Object):
+            # Scalars are converted to Python types
+            continue
+        elif v.is_indirect:
+            if v.objgen in replace:
+                obj[k] = replace[v.objgen]
+                changed = True
+        else:
+            changed = _replace_references(v, replace) or changed
+    return changed
+
+def deduplicate_resources(pdf: pikepdf.Pdf, max_passes: int = 5) -> int:
+    """ 
+    Merge identical streams and resource dictionaries (for example fonts, which are embedded by each merged document) by
+    their content hash. Objects referencing deduplicated objects can become identical themselves, so multiple passes are
+    made. Only the objects whose references were replaced are hashed again. Returns the number of removed objects
+    """
+    data_hashes: dict[tuple[int, int], bytes] = {}
+    objects: dict[tuple[int, int], pikepdf.Object] = {}
+    keys: dict[tuple[int, int], bytes] = {}
+    for obj in pdf.objects:
+        if (key := _dedup_key(obj, data_hashes)) is not None:
+            objects[obj.objgen] = obj
+            keys[obj.objgen] = key
+
+    removed: set[tuple[int, int]] = set()
+    for _ in range(max_passes):
+        canonical: dict[bytes, pikepdf.Object] = {}
+        replace: dict[tuple[int, int], pikepdf.Object] = {}
+        for objgen, key in keys.items():
+            # Replaced objects stay in the object table until the file is saved
+            if objgen in removed:
+                continue
+            if key in canonical:
+                replace[objgen] = canonical[key]
+            else:
+                canonical[key] = objects[objgen]
+        if len(replace) == 0:
+            break
+        removed.update(replace.keys())
+        for obj in pdf.objects:
+            if _replace_references(obj, replace) and obj.objgen in keys and obj.objgen not in removed:
+                keys[obj.objgen] = cast(bytes, _dedup_key(obj, data_hashes))
+        _replace_references(pdf.trailer, replace)
+    return len(removed)
+
+def copy_pdfa_identification(source: pikepdf.Pdf, target: pikepdf.Pdf) -> str|None:
+    """
+    Copy the output intents and the PDF/A identification in the XMP metadata from the source to the target PDF, for example
+    when a document is assembled from PDF/A files written by OCRmyPDF. Returns the PDF/A status of the source (e.g. '2B') or
+    None if the source does not claim PDF/A conformance
+    """
+    status = source.open_metadata().pdfa_status
+    if status == "":
+        return None
+    if "/OutputIntents" in source.Root:
+        intents = source.Root.OutputIntents
+        # Only indirect objects can be copied between PDFs
+        target.Root.OutputIntents = target.copy_foreign(intents if intents.is_indirect else source.make_indirect(intents))
+    with target.open_metadata(set_pikepdf_as_editor=False) as meta:
+        meta["pdfaid:part"] = status[0]
+        meta["pdfaid:conformance"] = status[1:]
+    return status
+
+
+class TaskLane:
+    """
+    A lane queues and executes all tasks of a single resource class with a fixed number of worker threads. Tasks whose
+    dependencies have been resolved are queued with priority, so that started pipelines are finished first
+    """
+
+    def __init__(self, resource_class: ResourceClass, num_workers: int) -> None:
+        self.resource_class = resource_class
+        self.num_workers = num_workers
+        self.queue: PriorityQueue[tuple[int, int, Task]] = PriorityQueue()
+        self.threads: list[threading.Thread] = []
+        self._counter = itertools.count()
+
+    def put(self, task: Task, priority: bool = False) -> None:
+        self.queue.put((0 if priority else 1, next(self._counter), task))
+
+    def get(self, timeout: float|None = None) -> Task:
+        """ Get the next task. Raises queue.Empty after the timeout """
+        return self.queue.get(block=True, timeout=timeout)[2]
+    
+    def start(self) -> None:
+        self.threads = [threading.Thread(target=_pdfworker_handler, args=(self,), name=f"PDFworker {self.resource_class.value} {i}", daemon=True) 
+                        for i in range(self.num_workers)]
+        for t in self.threads:
+            t.start()
+    
+    def __str__(self) -> str:
+        return f"TaskLane '{self.resource_class.value}' ({self.num_workers} workers)"
+
+running_tasks: dict[int, Task] = {}
+_clean_lock = threading.Lock()
+
+def _pdfworker_handler(lane: TaskLane) -> None:
+    logger.debug(f"Started the pdf worker '{threading.current_thread().name}' (thread {threading.current_thread().native_id})")
     try:
-        _pdfworker_loop()
+        _pdfworker_loop(lane)
     except Exception as ex:
         logger.error(f"The pdf worker loop crashed", exc_info=True)
         logger.critical(f"Terminating pyPDFserver")
@@ -604,126 +1647,164 @@ except ValueError:
 if task_keep_time <= 0:
     raise ConfigError(f"Invalid value {task_keep_time} for 'task_keep_time' in section 'SETTINGS'")
 
+try:
+    ocr_in_worker_process = config.getboolean("SETTINGS", "ocr_in_worker_process", fallback=True)
+except ValueError:
+    raise ConfigError(f"Invalid value for 'ocr_in_worker_process' in section 'SETTINGS'")
+
+try:
+    export_keep_alive = config.getint("EXPORT_FTP_SERVER", "keep_alive", fallback=60)
+except ValueError:
+    raise ConfigError(f"Invalid value for 'keep_alive' in section 'EXPORT_FTP_SERVER'")
+if export_keep_alive < 0:
+    raise ConfigError(f"Invalid value {export_keep_alive} for 'keep_alive' in section 'EXPORT_FTP_SERVER'")
+
+try:
+    spool_failed_uploads = config.getboolean("EXPORT_FTP_SERVER", "spool_failed_uploads", fallback=True)
+except ValueError:
+    raise ConfigError(f"Invalid value for 'spool_failed_uploads' in section 'EXPORT_FTP_SERVER'")
+
+try:
+    spool_max_retry_interval = config.getint("EXPORT_FTP_SERVER", "spool_max_retry_interval", fallback=3600)
+except ValueError:
+    raise ConfigError(f"Invalid value for 'spool_max_retry_interval' in section 'EXPORT_FTP_SERVER'")
+if spool_max_retry_interval <= 0:
+    raise ConfigError(f"Invalid value {spool_max_retry_interval} for 'spool_max_retry_interval' in section 'EXPORT_FTP_SERVER'")
+
+try:
+    ocr_cache_size = config.getint("SETTINGS", "ocr_cache_size", fallback=0)
+except ValueError:
+    raise ConfigError(f"Invalid value for 'ocr_cache_size' in section 'SETTINGS'")
+if ocr_cache_size < 0:
+    raise ConfigError(f"Invalid value {ocr_cache_size} for 'ocr_cache_size' in section 'SETTINGS'")
+
+def _get_num_workers(field: str, default: int) -> int:
+    try:
+        num_workers = config.getint("SETTINGS", field, fallback=-1)
+    except ValueError:
+        num_workers = -1
+    if num_workers < 1:
+        logger.info(f"No or invalid value for '{field}' set. Defaulting to {default}")
+        num_workers = default
+    return num_workers
+
+lanes: dict[ResourceClass, TaskLane] = {
+    ResourceClass.INSTANT: TaskLane(ResourceClass.INSTANT, 1),
+    ResourceClass.IO: TaskLane(ResourceClass.IO, _get_num_workers("num_io_workers", 4)),
+    ResourceClass.CPU_LIGHT: TaskLane(ResourceClass.CPU_LIGHT, _get_num_workers("num_pdf_workers", 2)),
+    ResourceClass.CPU_HEAVY: TaskLane(ResourceClass.CPU_HEAVY, _get_num_workers("num_workers", 2)),
+}
+
+# Logged in connections to the export servers are kept open for reuse
+export_pool = FTPConnectionPool(idle_time=export_keep_alive, max_idle_connections=lanes[ResourceClass.IO].num_workers)
+atexit.register(export_pool.close_all)
+
+# Uploads failing because the export server is not reachable are kept on disk and retried later
+export_spool: UploadSpool|None = None
+if spool_failed_uploads:
+    export_spool = UploadSpool(platformdirs.user_data_path(appname="pyPDFserver", appauthor=False) / "upload_spool", 
+                               export_pool, 
+                               min_delay=min(30, spool_max_retry_interval),
+                               max_delay=spool_max_retry_interval)
+
+
+# OCR results are kept on disk, so that documents sent again do not need to be processed again
+ocr_cache: OCRCache|None = None
+if ocr_cache_size > 0:
+    ocr_cache = OCRCache(platformdirs.user_cache_path(appname="pyPDFserver", appauthor=False) / "ocr", max_size=ocr_cache_size*1024**2)
 
 def clean() -> None:
-    for t in Task.task_list.copy():
-        # First remove old tasks
-        if (datetime.now() - t.t_created).total_seconds() > task_keep_time*60:
-            Task.task_list.remove(t)
-            t.clean_up()
-            match t.state:
-                case TaskState.RUNNING:
-                    logger.info(f"Running task '{str(t)}' marked for time out")
-                case TaskState.CREATED | TaskState.SCHEDULED | TaskState.WAITING:
-                    logger.info(f"Task '{str(t)}' timed out")
-                case _:
-                    logger.debug(f"Garbage collected task '{str(t)}'")
+    # Only one worker needs to clean up at the same time
+    if not _clean_lock.acquire(blocking=False):
+        return
+    try:
+        _clean()
+    finally:
+        _clean_lock.release()
+
+def _clean() -> None:
+    """ Remove expired tasks """
+    for t in Task.registry.expired(datetime.now() - timedelta(minutes=task_keep_time)):
+        if not Task.registry.remove(t):
             continue
-
-        # Now check if waiting task is ready (put to priority queue) or has failed dependencies
-        if t.state != TaskState.WAITING:
+        if t.group is not None and len(Task.registry.by_group(t.group)) == 0:
+            with Task.lock:
+                Task.groups.pop(t.group, None)
+        if isinstance(t, TaskRecord):
+            logger.debug(f"Removed archived task '{str(t)}'")
             continue
-
-        task_ready = True
-        if len(t.external_dependencies) > 0:
-            task_ready = False
-        for d in t.dependencies:
-            match d.state:
-                case TaskState.CREATED | TaskState.SCHEDULED | TaskState.WAITING | TaskState.RUNNING:
-                    task_ready = False
-                case TaskState.FINISHED:
-                    pass
-                case _:
-                    task_ready = False
-                    t.state = TaskState.DEPENDENCY_FAILED
-                    break
-        if t.state != TaskState.WAITING:
-            logger.debug(f"Task '{str(t)}' was marked as DEPENDENCY_FAILED")
-        elif task_ready:
-            t.state = TaskState.SCHEDULED
-            task_priority_queue.put(t)
-            logger.debug(f"Task '{str(t)}' was moved from WAITING to SCHEDULED")
-
-def _pdfworker_loop() -> None:
-    """ Implements the main thread loop """
-    global current_task
+        match t.state:
+            case TaskState.RUNNING:
+                t.try_abort()
+                logger.info(f"Running task '{str(t)}' marked for time out")
+            case TaskState.CREATED | TaskState.SCHEDULED | TaskState.WAITING:
+                t.set_state(TaskState.ABORTED, expected=[TaskState.CREATED, TaskState.SCHEDULED, TaskState.WAITING])
+                logger.info(f"Task '{str(t)}' timed out")
+            case _:
+                logger.debug(f"Garbage collected task '{str(t)}'")
+        t.clean_up()
+
+def _pdfworker_loop(lane: TaskLane) -> None:
+    """ Implements the loop of a single worker thread. All workers of a lane share the same queue """
+    thread_id = threading.get_ident()
     while True:
-        current_task = None
+        with Task.lock:
+            running_tasks.pop(thread_id, None)
 
         clean()
 
-        # Get next task
+        # Get next task. Only tasks with resolved dependencies are queued
         try:
-            current_task = task_priority_queue.get_nowait()
+            task = lane.get(timeout=5*60)
         except Empty:
-            try:
-                current_task = task_queue.get(block=True, timeout=5*60)
-            except Empty:
-                continue
-
-        if current_task not in Task.task_list:
-            logger.debug(f"Skipped task '{str(current_task)}' as it timed out")
-            continue
-        elif current_task.state == TaskState.ABORTED:
-            continue
-        elif current_task.state != TaskState.SCHEDULED:
-            current_task.state = TaskState.UNKOWN_ERROR
-            logger.debug(f"Unexpected TaskState {current_task.state} for task '{current_task}' in queue. Skipping it")
             continue
 
-        current_task.state = TaskState.RUNNING
-
-        # Check if all dependencies for the task are resolved
-        dependencies_resolved = True
-        if len(current_task.external_dependencies) > 0:
-            dependencies_resolved = False
-        for d in current_task.dependencies:
-            match d.state:
-                case TaskState.FINISHED:
-                    pass
-                case TaskState.CREATED | TaskState.SCHEDULED | TaskState.WAITING | TaskState.RUNNING:
-                    dependencies_resolved = False
-                case _:
-                    dependencies_resolved = False
-                    current_task.state = TaskState.DEPENDENCY_FAILED
-                    break
-        if current_task.state != TaskState.RUNNING:
-            logger.debug(f"Task '{str(current_task)}' was marked as DEPENDENCY_FAILED")
+        if task not in Task.registry:
+            logger.debug(f"Skipped task '{str(task)}' as it timed out")
             continue
-        elif not dependencies_resolved:
-            current_task.state = TaskState.WAITING
-            logger.debug(f"Task '{str(current_task)}' was marked as WAITING")
+        elif not task.set_state(TaskState.RUNNING, expected=[TaskState.SCHEDULED]):
+            # For example aborted tasks
             continue
 
-        logger.debug(f"Executing task '{str(current_task)}'")
+        with Task.lock:
+            running_tasks[thread_id] = task
+
+        logger.debug(f"Executing task '{str(task)}'")
         
         try:
-            current_task.t_start = datetime.now()
-            current_task.run()
+            task.t_start = datetime.now()
+            task.run()
         except TaskException as ex:
-            current_task.state = TaskState.FAILED
-            current_task.error = ex
-            logger.info(f"Task '{str(current_task)}' failed: {ex.message}")
-            continue
+            task.error = ex
+            task.t_end = datetime.now()
+            if task.set_state(TaskState.FAILED, expected=[TaskState.RUNNING]):
+                logger.info(f"Task '{str(task)}' failed: {ex.message}")
         except Exception as ex:
-            current_task.state = TaskState.FAILED
-            current_task.error = TaskException("Unexpected error")
-            logger.warning(f"Failed to process task '{str(current_task)}': ", exc_info=True)
-            continue
-        finally:
-            current_task.t_end = datetime.now()
+            task.error = TaskException("Unexpected error")
+            task.t_end = datetime.now()
+            if task.set_state(TaskState.FAILED, expected=[TaskState.RUNNING]):
+                logger.warning(f"Failed to process task '{str(task)}': ", exc_info=True)
+        else:
+            task.t_end = datetime.now()
+            if task.set_state(TaskState.FINISHED, expected=[TaskState.RUNNING]):
+                logger.debug(f"Finished task '{str(task)}'")
 
-        current_task.state = TaskState.FINISHED
-        logger.debug(f"Finished task '{str(current_task)}'")
+        # Also archives tasks aborted while running
+        task.archive()
+        # Do not keep the task alive while waiting for the next one
+        del task
 
 def run() -> None:
-    """ Start the server loop """
-    global worker_thread, current_task
-
-    if current_task is not None and current_task.state.value < 10:
-        current_task.state = TaskState.ABORTED
-
-    worker_thread = threading.Thread(target=_pdfworker_handler, name="PDFworker loop", daemon=True)
-    worker_thread.start()
+    """ Start the worker threads """
+    with Task.lock:
+        for t in running_tasks.values():
+            t.set_state(TaskState.ABORTED, expected=[TaskState.CREATED, TaskState.SCHEDULED, TaskState.WAITING, TaskState.RUNNING])
+        running_tasks.clear()
+
+    for lane in lanes.values():
+        lane.start()
+    if export_spool is not None:
+        export_spool.start()
+    logger.debug(f"Started the pdf worker lanes: {', '.join([str(lane) for lane in lanes.values()])}")
 
 run()
\ No newline at end of file
@@ -1,19 +1,25 @@
 from .core import *
-from .pdf_worker import Task, WaitForFileTask, PDFTask, OCRTask, DuplexTask, UploadToFTPTask, Artifact, FileArtifact
+from .ocr_cache import HashingWriter, file_sha256
+from .pdf_worker import lanes, output_presets, ResourceClass, Task, TaskState, WaitForFileTask, PDFTask, OCRTask, DuplexTask, UploadToFTPTask, ExportToDirectoryTask, SplitPDFTask, MergePDFTask, DetectBlankPagesTask, Artifact, FileArtifact, FileArtifactLink, get_page_count, export_spool
 
 import hashlib
+import os
 import pyftpdlib.log
 import re
+import socket
 import tempfile
 import uuid
+import weakref
 from collections import defaultdict
 from datetime import datetime
 from pathlib import Path
+from queue import Queue
 from pyftpdlib.authorizers import DummyAuthorizer
-from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.filesystems import AbstractedFS
+from pyftpdlib.handlers import DTPHandler, FTPHandler
 from pyftpdlib.servers import FTPServer
 from threading import Thread
-from typing import NamedTuple
+from typing import cast, NamedTuple
 
 pyftpdlib.log.logger.setLevel(log.logging.INFO)
 pyftpdlib.log.logger.addHandler(file_log_handler)
@@ -26,10 +32,45 @@ class PDFAuthorizer(DummyAuthorizer):
         return super().validate_authentication(username, hashlib.sha256(password.encode("utf-8")).hexdigest(), handler)
 
 
+class PDF_AbstractedFS(AbstractedFS):
+    """ 
+    Writes files uploaded by STOR directly into a FileArtifact instead of the client directory. The artifacts are 
+    indexed by their path, which is passed by pyftpdlib to on_file_received(). The SHA-256 hash of the file is computed
+    while it is received
+    """
+
+    def __init__(self, root: str, cmd_channel) -> None:
+        super().__init__(root, cmd_channel)
+        self.uploads: dict[str, FileArtifact] = {}
+
+    def open(self, filename: str, mode: str):
+        if "w" not in mode:
+            return super().open(filename, mode)
+        artifact = FileArtifact(None, os.path.basename(filename))
+        f = open(artifact.path, mode)
+        self.uploads[f.name] = artifact
+        return HashingWriter(f, lambda h: setattr(artifact, "sha256", h))
+
+
+class PDF_DTPHandler(DTPHandler):
+    """ Data channel with a configurable receive buffer size """
+
+    ac_in_buffer_size = 262144
+
+    def __init__(self, sock, cmd_channel) -> None:
+        super().__init__(sock, cmd_channel)
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.ac_in_buffer_size)
+        except OSError as ex:
+            logger.debug(f"Failed to set the receive buffer size of the data channel: {str(ex)}")
+
+
 class PDF_FTPHandler(FTPHandler):
 
     banner = "pyPDFserver"
     server: "PDF_FTPServer"
+    abstracted_fs = PDF_AbstractedFS
+    dtp_handler = PDF_DTPHandler
 
     def __init__(self, conn, server, ioloop=None):
         super().__init__(conn, server, ioloop)
@@ -52,202 +93,25 @@ class PDF_FTPHandler(FTPHandler):
 
     def on_file_received(self, file: str) -> None:
         super().on_file_received(file)
-        profile = PDF_FTPHandler.server.profiles[self.username]
-        path = Path(file)
-        file_name = path.name
-
-        if not profile.input_case_sensitive:
-            file_name = file_name.lower()
-
-        logger.debug(f"Received file '{file_name}' on profile '{profile.name}'")
-
-        artifact = FileArtifact(None, file_name)
-        with open(path, "rb") as f_upload:
-            with open(artifact.path, "wb+") as f_artifact:
-                f_artifact.write(f_upload.read())
-        path.unlink()
-
-        if not path.suffix.lower() == ".pdf":
-            logger.info(f"Discarded file '{file_name}' because it is no PDF file")
+        upload = self.fs.uploads.pop(file, None) if isinstance(self.fs, PDF_AbstractedFS) else None
+        if upload is None:
+            # Files not written by STOR (e.g. APPE) are stored in the client directory
+            upload = FileArtifact.from_file(Path(file), Path(file).name)
+        # The client may log in as another user before the file is processed, so the profile is determined right away
+        if (profile := PDF_FTPHandler.server.profiles.get(self.username, None)) is None:
+            logger.warning(f"Discarded '{upload.name}' as no profile exists for user '{self.username}'")
+            upload.cleanup()
             return
-
-        if (r := profile.duplex1_regex.match(file_name)) is not None:
-            logger.info(f"Received duplex front pages '{file_name}' by user '{self.username}'")
-            if profile.duplex_pdf_cache is not None:
-                logger.info(f"Discarding previous duplex pront pages '{profile.duplex_pdf_cache.file1_name}'")
-                profile.duplex_pdf_cache.wait_for_file2_task.try_abort()
-                profile.duplex_pdf_cache = None
-
-            tasks: list[Task] = []
-            group = str(uuid.uuid4())
-
-            wait_for_file1_task = WaitForFileTask(display_name="Receive duplex front pages", display_desc="", hidden=False, group=group)
-            wait_for_file1_task.file_artifact = artifact
-            wait_for_file1_task.set_group_name(f"{file_name} (profile {profile.username})")
-            tasks.append(wait_for_file1_task)
-
-            wait_for_file2_task = WaitForFileTask(display_name="Receive duplex back pages", display_desc="Waiting for user upload", hidden=False, group=group)
-            wait_for_file2_task.add_external_dependency("duplex2_upload")
-            tasks.append(wait_for_file2_task)
-            
-            ocr_duplex1_task, ocr_duplex2_task = None, None
-
-            if profile.ocr_enabled:
-                ocr_duplex1_task = OCRTask(wait_for_file1_task.file_artifact_link, 
-                                     file_name=file_name, 
-                                     language=profile.ocr_language, 
-                                     optimize=profile.ocr_optimize, 
-                                     deskew=profile.ocr_deskew, 
-                                     rotate_pages=profile.ocr_rotate_pages,
-                                     jpg_quality=profile.ocr_jpg_quality,
-                                     png_quality=profile.ocr_png_quality,
-                                     color_conversion_strategy=profile.ocr_color_conversion_strategy,
-                                     num_jobs=PDF_FTPHandler.server.num_threads,
-                                     tesseract_timeout=profile.ocr_tesseract_timeout,
-                                     group=group
-                                     )
-                
-                ocr_duplex2_task = OCRTask(wait_for_file2_task.file_artifact_link, 
-                                     file_name="", 
-                                     language=profile.ocr_language, 
-                                     optimize=profile.ocr_optimize, 
-                                     deskew=profile.ocr_deskew, 
-                                     rotate_pages=profile.ocr_rotate_pages,
-                                     jpg_quality=profile.ocr_jpg_quality,
-                                     png_quality=profile.ocr_png_quality,
-                                     color_conversion_strategy=profile.ocr_color_conversion_strategy,
-                                     num_jobs=PDF_FTPHandler.server.num_threads,
-                                     tesseract_timeout=profile.ocr_tesseract_timeout,
-                                     group=group
-                                     )
-                
-                ocr_duplex1_task.dependencies.append(wait_for_file1_task)
-                ocr_duplex2_task.dependencies.append(wait_for_file2_task)
-                tasks.append(ocr_duplex1_task)
-                tasks.append(ocr_duplex2_task)
-                
-            duplex_task = DuplexTask(
-                wait_for_file1_task.file_artifact_link if ocr_duplex1_task is None else ocr_duplex1_task.export_artifact_link,
-                wait_for_file2_task.file_artifact_link if ocr_duplex2_task is None else ocr_duplex2_task.export_artifact_link,
-                file1_name=file_name,
-                file2_name="",
-                export_name="",
-                group=group
-            )
-            duplex_task.dependencies.append(wait_for_file1_task if ocr_duplex1_task is None else ocr_duplex1_task)
-            duplex_task.dependencies.append(wait_for_file2_task if ocr_duplex2_task is None else ocr_duplex2_task)
-            tasks.append(duplex_task)
-
-            upload_task = UploadToFTPTask(duplex_task.export_artifact_link, 
-                file_name="",
-                address=(PDF_FTPHandler.server.export_config.host, PDF_FTPHandler.server.export_config.port),
-                username=PDF_FTPHandler.server.export_config.username,
-                password=PDF_FTPHandler.server.export_config.password,
-                folder=profile.export_path,
-                tls=True,
-                group=group
-            )
-            upload_task.dependencies.append(duplex_task)
-            tasks.append(upload_task)
-        
-            for t in tasks:
-                t.schedule()
-
-            profile.duplex_pdf_cache = PDFProfile.DuplexCache(wait_for_file2_task=wait_for_file2_task,
-                                                              ocr_duplex2_task=ocr_duplex2_task, 
-                                                              duplex_task=duplex_task, 
-                                                              upload_task=upload_task,
-                                                              time=datetime.now(),
-                                                              file1_name=file_name,
-                                                              file1_regex=r
-                                                              )
-
-        elif (r := profile.duplex2_regex.match(file_name)):
-            
-            if profile.duplex_pdf_cache is None:
-                logger.info(f"Received duplex back pages '{file_name}', but discarded them as the pront pages are missing")
-                return
-            elif (d := (datetime.now() - profile.duplex_pdf_cache.time)).total_seconds() > PDF_FTPHandler.server.duplex_timeout:
-                logger.info(f"Received duplex back pages '{file_name}', but discarded them due to timeout (first file received {d.total_seconds()} ago)")
-                profile.duplex_pdf_cache.wait_for_file2_task.try_abort()
-                profile.duplex_pdf_cache = None
-                return
-            
-            logger.info(f"Received duplex back pages '{file_name}' by user '{self.username}'")
-
-            export_name = profile.export_duplex_template
-            export_name = export_name.replace("(lang)", profile.ocr_language)
-            if "s" in profile.duplex_pdf_cache.file1_regex.groupdict():
-                export_name = export_name.replace("(*)", profile.duplex_pdf_cache.file1_regex.group("s"))
-                export_name = export_name.replace("(*1)", profile.duplex_pdf_cache.file1_regex.group("s"))
-            if "s" in r.groupdict():
-                export_name = export_name.replace("(*2)", r.group("s"))
-
-            # Update names in the tasks
-            profile.duplex_pdf_cache.duplex_task.set_group_name(f"'{profile.duplex_pdf_cache.file1_name}' + '{file_name}' -> {export_name} (profile {profile.username})")
-            if profile.duplex_pdf_cache.ocr_duplex2_task is not None:
-                profile.duplex_pdf_cache.ocr_duplex2_task.file_name = file_name
-            profile.duplex_pdf_cache.duplex_task.file2_name = file_name
-            profile.duplex_pdf_cache.duplex_task.export_name = export_name
-            profile.duplex_pdf_cache.upload_task.file_name = export_name
-
-            profile.duplex_pdf_cache.wait_for_file2_task.file_artifact = artifact
-            profile.duplex_pdf_cache.wait_for_file2_task.release_external_dependency("duplex2_upload")
-
-            profile.duplex_pdf_cache = None
-            
-        elif (r := profile.input_pdf_regex.match(file_name)):
-            logger.info(f"Received file '{file_name}' by user '{self.username}'")
-
-            export_name = profile.export_pdf_template
-            export_name = export_name.replace("(lang)", profile.ocr_language)
-            export_name = export_name.replace("(*)", r.group("s"))
-
-            tasks: list[Task] = []
-            group = str(uuid.uuid4())
-
-            wait_for_file_task = WaitForFileTask(display_name="Receive user upload", display_desc="", hidden=True, group=group)
-            wait_for_file_task.file_artifact = artifact
-            wait_for_file_task.set_group_name(f"{export_name} (profile {profile.username})")
-            tasks.append(wait_for_file_task)
-
-            ocr_task = None
-            if profile.ocr_enabled:
-                ocr_task = OCRTask(wait_for_file_task.file_artifact_link, 
-                                     file_name=file_name, 
-                                     language=profile.ocr_language, 
-                                     optimize=profile.ocr_optimize, 
-                                     deskew=profile.ocr_deskew, 
-                                     rotate_pages=profile.ocr_rotate_pages,
-                                     jpg_quality=profile.ocr_jpg_quality,
-                                     png_quality=profile.ocr_png_quality,
-                                     color_conversion_strategy=profile.ocr_color_conversion_strategy,
-                                     num_jobs=PDF_FTPHandler.server.num_threads,
-                                     tesseract_timeout=profile.ocr_tesseract_timeout,
-                                     group=group
-                                     )
-                ocr_task.dependencies.append(wait_for_file_task)
-                tasks.append(ocr_task)
-            pdf_task = PDFTask(wait_for_file_task.file_artifact_link if ocr_task is None else ocr_task.export_artifact_link, file_name=file_name, group=group)
-            pdf_task.dependencies.append(wait_for_file_task if ocr_task is None else ocr_task)
-            tasks.append(pdf_task)
-
-            upload_task = UploadToFTPTask(pdf_task.export_artifact_link, 
-                export_name,
-                address=(PDF_FTPHandler.server.export_config.host, PDF_FTPHandler.server.export_config.port),
-                username=PDF_FTPHandler.server.export_config.username,
-                password=PDF_FTPHandler.server.export_config.password,
-                folder=profile.export_path,
-                tls=True,
-                group=group
-            )
-            upload_task.dependencies.append(pdf_task)
-            tasks.append(upload_task)
-
-            for t in tasks:
-                t.schedule()
+        # Do not block the I/O loop while creating the tasks
+        PDF_FTPHandler.server.ingest_queue.put((upload, profile))
+
+    def on_incomplete_file_received(self, file: str) -> None:
+        super().on_incomplete_file_received(file)
+        if isinstance(self.fs, PDF_AbstractedFS) and (upload := self.fs.uploads.pop(file, None)) is not None:
+            logger.info(f"Discarded incomplete upload '{upload.name}' by user '{self.username}'")
+            upload.cleanup()
         else:
-            logger.info(f"Discarded file '{file_name}' not matching any rules")
+            Path(file).unlink(missing_ok=True)
 
 class PDFProfile:
 
@@ -259,11 +123,13 @@ class PDFProfile:
     class DuplexCache(NamedTuple):
         duplex_task: DuplexTask
         wait_for_file2_task: WaitForFileTask
-        ocr_duplex2_task: OCRTask|None
-        upload_task: UploadToFTPTask
+        ocr_duplex2_tasks: list[OCRTask|SplitPDFTask|MergePDFTask|DetectBlankPagesTask]
+        ocr_merged_tasks: list[OCRTask|SplitPDFTask|MergePDFTask]
+        export_tasks: list[UploadToFTPTask|ExportToDirectoryTask]
         time: datetime
         file1_name: str
         file1_regex: re.Match
+        num_pages: int
 
     def __init__(self, name: str) -> None:
         self.name = name
@@ -338,6 +204,35 @@ class PDFProfile:
         if self.ocr_tesseract_timeout <= 0:
             self.ocr_tesseract_timeout = None
 
+        try:
+            self.ocr_shard_pages = profiles_config.getint(self.name, "ocr_shard_pages", fallback=0)
+        except ValueError:
+            raise ConfigError(f"Invalid field 'ocr_shard_pages' in profile '{self.name}'")
+
+        try:
+            self.remove_blank_pages = profiles_config.getboolean(self.name, "remove_blank_pages", fallback=False)
+        except ValueError:
+            raise ConfigError(f"Invalid field 'remove_blank_pages' in profile '{self.name}'")
+        
+        try:
+            self.blank_page_threshold = profiles_config.getfloat(self.name, "blank_page_threshold", fallback=0.1) / 100
+        except ValueError:
+            raise ConfigError(f"Invalid field 'blank_page_threshold' in profile '{self.name}'")
+        if self.blank_page_threshold < 0 or self.blank_page_threshold > 1:
+            raise ConfigError(f"Invalid field 'blank_page_threshold' in profile '{self.name}'")
+
+        output_preset = profiles_config.get(self.name, "output_preset", fallback="").strip().lower()
+        if output_preset == "":
+            output_preset = "default"
+        if output_preset not in output_presets:
+            raise ConfigError(f"Invalid field 'output_preset' in profile '{self.name}'. Valid presets are {', '.join(output_presets.keys())}")
+        self.output_preset = output_presets[output_preset]
+
+        try:
+            self.ocr_duplex_merge_first = profiles_config.getboolean(self.name, "ocr_duplex_merge_first", fallback=False)
+        except ValueError:
+            raise ConfigError(f"Invalid field 'ocr_duplex_merge_first' in profile '{self.name}'")
+
         try:
             self.input_case_sensitive = profiles_config.getboolean(self.name, "input_case_sensitive")
         except ValueError:
@@ -385,11 +280,20 @@ class PDFProfile:
             raise ConfigError(f"Missing field 'export_path' in profile '{self.name}'")
         self.export_path = export_path
 
+        export_sinks = profiles_config.get(self.name, "export_sinks", fallback="")
+        self.export_sinks = [s.strip() for s in export_sinks.split(",") if s.strip() != ""]
+        if len(self.export_sinks) == 0:
+            self.export_sinks = ["default"]
+
         self.duplex_pdf_cache: None|PDFProfile.DuplexCache = None
 
 
 class PDF_FTPServer:
 
+    class InflightJob(NamedTuple):
+        task: "weakref.ReferenceType[PDFTask|OCRTask]"
+        export_name: str
+
     def __init__(self) -> None:
         try:
             self.duplex_timeout = config.getint("SETTINGS", "duplex_timeout")
@@ -462,6 +366,17 @@ class PDF_FTPServer:
             self.num_threads = -1
         if self.num_threads < 1:
             self.num_threads = None
+        # The threads are shared by the concurrently running OCR tasks
+        self.ocr_num_jobs = max(1, (self.num_threads or os.cpu_count() or 1) // lanes[ResourceClass.CPU_HEAVY].num_workers)
+        logger.debug(f"Using {self.ocr_num_jobs} jobs per OCR task")
+
+        try:
+            self.data_buffer_size = config.getint("FTP", "data_buffer_size", fallback=262144)
+        except ValueError:
+            raise ConfigError(f"Invalid field 'data_buffer_size' in section 'FTP'")
+        if self.data_buffer_size < 4096:
+            raise ConfigError(f"Invalid field 'data_buffer_size' in section 'FTP': Must be at least 4096 bytes")
+        PDF_DTPHandler.ac_in_buffer_size = self.data_buffer_size
 
         handler = PDF_FTPHandler
         handler.authorizer = authorizer
@@ -472,7 +387,36 @@ class PDF_FTPServer:
 
         self.server = FTPServer((self.local_ip, self.port), handler)
 
-        self.export_config = ExportFTP()
+        self.export_sinks: dict[str, ExportSink] = {}
+        if config.get("EXPORT_FTP_SERVER", "host", fallback="").strip() != "":
+            self.export_sinks["default"] = ExportFTP()
+        for section in config.sections():
+            if not section.startswith("SINK:"):
+                continue
+            sink_name = section.removeprefix("SINK:").strip()
+            match config.get(section, "type", fallback="").strip().lower():
+                case "ftp":
+                    self.export_sinks[sink_name] = ExportFTP(section, sink_name)
+                case "directory":
+                    self.export_sinks[sink_name] = ExportDirectory(section, sink_name)
+                case _:
+                    raise ConfigError(f"Missing or invalid field 'type' in section '{section}'")
+        
+        for p in set(self.profiles.values()) | {self.default_profile}:
+            for sink_name in p.export_sinks:
+                if sink_name in self.export_sinks:
+                    continue
+                elif sink_name == "default":
+                    raise ConfigError(f"Missing field 'host' in section 'EXPORT_FTP_SERVER'")
+                raise ConfigError(f"Unknown export sink '{sink_name}' in profile '{p.name}'")
+        logger.debug(f"Loaded export sinks: {', '.join([str(s) for s in self.export_sinks.values()])}")
+
+        # Jobs of single uploads by content hash and profile name, to share their result with identical uploads
+        self.inflight_jobs: dict[tuple[str, str], PDF_FTPServer.InflightJob] = {}
+
+        self.ingest_queue: Queue[tuple[FileArtifact, PDFProfile]|None] = Queue()
+        self.ingest_thread = Thread(target=self._ingest_loop, name="PDF_FTPServer_ingest", daemon=True)
+        self.ingest_thread.start()
 
         self.thread = Thread(target=self._loop, name="PDF_FTPServer_main", daemon=True)
         self.thread.start()
@@ -483,34 +427,430 @@ class PDF_FTPServer:
     def _loop(self) -> None:
         self.server.serve_forever(handle_exit=True)
 
+    def _ingest_loop(self) -> None:
+        """ Process the received files one after another """
+        while (item := self.ingest_queue.get()) is not None:
+            artifact, profile = item
+            try:
+                self.process_file(artifact, profile)
+            except Exception:
+                logger.error(f"Failed to process the received file '{artifact.name}': ", exc_info=True)
+            del artifact, profile, item
+
+    def process_file(self, artifact: FileArtifact, profile: PDFProfile) -> None:
+        """ 
+        Create the tasks for a received file on the profile of the user who uploaded it. Called by the ingest thread in the order the
+        files were received. Rejected files are removed once the artifact goes out of scope 
+        """
+        file_name = artifact.name
+
+        if not profile.input_case_sensitive:
+            file_name = file_name.lower()
+
+        logger.debug(f"Received file '{file_name}' on profile '{profile.name}'")
+
+        if not Path(file_name).suffix.lower() == ".pdf":
+            logger.info(f"Discarded file '{file_name}' because it is no PDF file")
+            return
+
+        if (r := profile.duplex1_regex.match(file_name)) is not None:
+            logger.info(f"Received duplex front pages '{file_name}' by user '{profile.username}'")
+            # The page count is validated right away, so that no work is wasted on invalid uploads
+            if (num_pages := get_page_count(artifact.path)) is None:
+                logger.info(f"Discarded duplex front pages '{file_name}' as the file is no valid PDF")
+                return
+            
+            if profile.duplex_pdf_cache is not None:
+                logger.info(f"Discarding previous duplex pront pages '{profile.duplex_pdf_cache.file1_name}'")
+                Task.abort_group(profile.duplex_pdf_cache.duplex_task.group)
+                profile.duplex_pdf_cache = None
+
+            tasks: list[Task] = []
+            group = str(uuid.uuid4())
+
+            wait_for_file1_task = WaitForFileTask(display_name="Receive duplex front pages", display_desc="", hidden=False, group=group)
+            wait_for_file1_task.file_artifact = artifact
+            wait_for_file1_task.set_group_name(f"{file_name} (profile {profile.username})")
+            tasks.append(wait_for_file1_task)
+
+            wait_for_file2_task = WaitForFileTask(display_name="Receive duplex back pages", display_desc="Waiting for user upload", hidden=False, group=group)
+            wait_for_file2_task.add_external_dependency("duplex2_upload")
+            tasks.append(wait_for_file2_task)
+            
+            ocr_duplex2_tasks: list[OCRTask|SplitPDFTask|MergePDFTask|DetectBlankPagesTask] = []
+            duplex1_link, duplex2_link = wait_for_file1_task.file_artifact_link, wait_for_file2_task.file_artifact_link
+            duplex1_dependency, duplex2_dependency = wait_for_file1_task, wait_for_file2_task
+
+            blank1_task = self.create_blank_pages_task(profile, wait_for_file1_task, wait_for_file1_task.file_artifact_link, file_name, group)
+            blank2_task = self.create_blank_pages_task(profile, wait_for_file2_task, wait_for_file2_task.file_artifact_link, "", group)
+            if blank1_task is not None and blank2_task is not None:
+                tasks.extend([blank1_task, blank2_task])
+                ocr_duplex2_tasks.append(blank2_task)
+
+            ocr_merged = profile.ocr_enabled and profile.ocr_duplex_merge_first
+            if profile.ocr_enabled and not ocr_merged:
+                # The back pages are validated to have the same page count as the front pages
+                ocr_tasks, duplex1_dependency, duplex1_link = self.create_ocr_tasks(profile, wait_for_file1_task, wait_for_file1_task.file_artifact_link, 
+                                                                                    file_name, num_pages, group, blank1_task)
+                tasks.extend(ocr_tasks)
+                
+                ocr_tasks, duplex2_dependency, duplex2_link = self.create_ocr_tasks(profile, wait_for_file2_task, wait_for_file2_task.file_artifact_link, 
+                                                                                    "", num_pages, group, blank2_task)
+                tasks.extend(ocr_tasks)
+                ocr_duplex2_tasks.extend(ocr_tasks)
+                
+            duplex_task = DuplexTask(
+                duplex1_link,
+                duplex2_link,
+                file1_name=file_name,
+                file2_name="",
+                export_name="",
+                remove_pages1=blank1_task.blank_pages_link if blank1_task is not None else None,
+                remove_pages2=blank2_task.blank_pages_link if blank2_task is not None else None,
+                # The merged document is only an intermediate file if OCR is applied afterwards
+                preset=output_presets["fast"] if ocr_merged else profile.output_preset,
+                group=group
+            )
+            duplex_task.add_dependency(duplex1_dependency)
+            duplex_task.add_dependency(duplex2_dependency)
+            for t in [blank1_task, blank2_task]:
+                if t is not None:
+                    duplex_task.add_dependency(t)
+            tasks.append(duplex_task)
+
+            final_task: DuplexTask|OCRTask = duplex_task
+            ocr_merged_tasks: list[OCRTask|SplitPDFTask|MergePDFTask] = []
+            if ocr_merged:
+                # A single OCR run over all pages. Blank pages have already been removed by the duplex task
+                ocr_merged_tasks, ocr_task, _ = self.create_ocr_tasks(profile, duplex_task, duplex_task.export_artifact_link, "", None, group)
+                final_task = cast(OCRTask, ocr_task)
+                final_task.finalize = True
+                tasks.extend(ocr_merged_tasks)
+
+            export_tasks = self.create_export_tasks(profile, final_task, final_task.export_artifact_link, "", group)
+            tasks.extend(export_tasks)
+        
+            for t in tasks:
+                t.schedule()
+
+            profile.duplex_pdf_cache = PDFProfile.DuplexCache(wait_for_file2_task=wait_for_file2_task,
+                                                              ocr_duplex2_tasks=ocr_duplex2_tasks, 
+                                                              duplex_task=duplex_task, 
+                                                              ocr_merged_tasks=ocr_merged_tasks,
+                                                              export_tasks=export_tasks,
+                                                              time=datetime.now(),
+                                                              file1_name=file_name,
+                                                              file1_regex=r,
+                                                              num_pages=num_pages
+                                                              )
+
+        elif (r := profile.duplex2_regex.match(file_name)):
+            
+            if profile.duplex_pdf_cache is None:
+                logger.info(f"Received duplex back pages '{file_name}', but discarded them as the pront pages are missing")
+                return
+            elif (d := (datetime.now() - profile.duplex_pdf_cache.time)).total_seconds() > self.duplex_timeout:
+                logger.info(f"Received duplex back pages '{file_name}', but discarded them due to timeout (first file received {d.total_seconds()} ago)")
+                Task.abort_group(profile.duplex_pdf_cache.duplex_task.group)
+                profile.duplex_pdf_cache = None
+                return
+            
+            logger.info(f"Received duplex back pages '{file_name}' by user '{profile.username}'")
+
+            # Reject back pages not matching the front pages before any work is scheduled for them. The front pages are kept,
+            # so that the back pages can be uploaded again
+            if (num_pages := get_page_count(artifact.path)) != profile.duplex_pdf_cache.num_pages:
+                reason = "the file is no valid PDF" if num_pages is None else f"{num_pages} pages"
+                logger.info(f"Rejected duplex back pages '{file_name}' ({reason}) as the front pages '{profile.duplex_pdf_cache.file1_name}' have " 
+                            + f"{profile.duplex_pdf_cache.num_pages} pages. Waiting for another upload of the back pages")
+                profile.duplex_pdf_cache.wait_for_file2_task.display_desc = (f"Rejected '{file_name}' ({reason}). " 
+                                                                             + f"Waiting for back pages with {profile.duplex_pdf_cache.num_pages} pages")
+                return
+
+            export_name = profile.export_duplex_template
+            export_name = export_name.replace("(lang)", profile.ocr_language)
+            if "s" in profile.duplex_pdf_cache.file1_regex.groupdict():
+                export_name = export_name.replace("(*)", profile.duplex_pdf_cache.file1_regex.group("s"))
+                export_name = export_name.replace("(*1)", profile.duplex_pdf_cache.file1_regex.group("s"))
+            if "s" in r.groupdict():
+                export_name = export_name.replace("(*2)", r.group("s"))
+
+            # Update names in the tasks
+            profile.duplex_pdf_cache.duplex_task.set_group_name(f"'{profile.duplex_pdf_cache.file1_name}' + '{file_name}' -> {export_name} (profile {profile.username})")
+            for t in profile.duplex_pdf_cache.ocr_duplex2_tasks:
+                t.file_name = file_name
+            profile.duplex_pdf_cache.duplex_task.file2_name = file_name
+            profile.duplex_pdf_cache.duplex_task.export_name = export_name
+            for t in profile.duplex_pdf_cache.ocr_merged_tasks:
+                t.file_name = export_name
+            for t in profile.duplex_pdf_cache.export_tasks:
+                t.file_name = export_name
+
+            profile.duplex_pdf_cache.wait_for_file2_task.file_artifact = artifact
+            profile.duplex_pdf_cache.wait_for_file2_task.release_external_dependency("duplex2_upload")
+
+            profile.duplex_pdf_cache = None
+            
+        elif (r := profile.input_pdf_regex.match(file_name)):
+            logger.info(f"Received file '{file_name}' by user '{profile.username}'")
+
+            export_name = profile.export_pdf_template
+            export_name = export_name.replace("(lang)", profile.ocr_language)
+            export_name = export_name.replace("(*)", r.group("s"))
+
+            input_hash = artifact.sha256 if artifact.sha256 is not None else file_sha256(artifact.path)
+            if self.attach_to_inflight_job(profile, input_hash, export_name):
+                return
+
+            tasks: list[Task] = []
+            group = str(uuid.uuid4())
+
+            wait_for_file_task = WaitForFileTask(display_name="Receive user upload", display_desc="", hidden=True, group=group)
+            wait_for_file_task.file_artifact = artifact
+            wait_for_file_task.set_group_name(f"{export_name} (profile {profile.username})")
+            tasks.append(wait_for_file_task)
+
+            pdf_input_link, pdf_dependency = wait_for_file_task.file_artifact_link, wait_for_file_task
+
+            blank_task = self.create_blank_pages_task(profile, wait_for_file_task, wait_for_file_task.file_artifact_link, file_name, group)
+            if blank_task is not None:
+                tasks.append(blank_task)
+
+            # Documents already containing text are detected by the OCR task, so that the ingest thread does not parse them
+            if profile.ocr_enabled:
+                num_pages = get_page_count(artifact.path) if profile.ocr_shard_pages > 0 else None
+                ocr_tasks, pdf_dependency, pdf_input_link = self.create_ocr_tasks(profile, wait_for_file_task, wait_for_file_task.file_artifact_link, 
+                                                                                  file_name, num_pages, group, blank_task)
+                tasks.extend(ocr_tasks)
+
+            final_task: PDFTask|OCRTask
+            if isinstance(pdf_dependency, OCRTask) and blank_task is None:
+                # The OCR task can write the final file without scheduling another task
+                pdf_dependency.finalize = True
+                final_task = pdf_dependency
+            else:
+                final_task = PDFTask(pdf_input_link, 
+                                     file_name=file_name, 
+                                     remove_pages=blank_task.blank_pages_link if blank_task is not None else None, 
+                                     preset=profile.output_preset,
+                                     group=group)
+                final_task.add_dependency(pdf_dependency)
+                if blank_task is not None:
+                    final_task.add_dependency(blank_task)
+                tasks.append(final_task)
+
+            tasks.extend(self.create_export_tasks(profile, final_task, final_task.export_artifact_link, export_name, group))
+
+            for t in tasks:
+                t.schedule()
+            self.inflight_jobs[(input_hash, profile.name)] = PDF_FTPServer.InflightJob(weakref.ref(final_task), export_name)
+        else:
+            logger.info(f"Discarded file '{file_name}' not matching any rules")
+
+    def attach_to_inflight_job(self, profile: PDFProfile, input_hash: str, export_name: str) -> bool:
+        """ 
+        Attach an upload to a job of the same profile with identical content, which is still queued or running. Only export tasks
+        are created for the upload, which share the result of the existing job. Returns False if there is no such job
+        """
+        self.prune_inflight_jobs()
+        if (job := self.inflight_jobs.get((input_hash, profile.name), None)) is None or (producer := job.task()) is None:
+            return False
+        
+        with Task.lock:
+            if producer.state.is_final and not (producer.state == TaskState.FINISHED and "export" in producer.artifacts 
+                                                and producer.export_artifact.path.exists()):
+                return False
+            if export_name == job.export_name:
+                logger.info(f"Discarded '{export_name}' by user '{profile.username}' as an identical upload is already being processed")
+                return True
+            group = str(uuid.uuid4())
+            export_tasks = self.create_export_tasks(profile, producer, producer.export_artifact_link, export_name, group)
+            export_tasks[0].set_group_name(f"{export_name} (profile {profile.username}, shared with '{job.export_name}')")
+            for t in export_tasks:
+                t.schedule()
+        logger.info(f"Received '{export_name}' by user '{profile.username}' with identical content to '{job.export_name}'. Sharing the result")
+        return True
+
+    def create_export_tasks(self, 
+                            profile: PDFProfile, 
+                            dependency: Task, 
+                            input_link: FileArtifactLink, 
+                            file_name: str, 
+                            group: str) -> list[UploadToFTPTask|ExportToDirectoryTask]:
+        """ Create a task for each export sink of the profile. The tasks are independent of each other and run in parallel """
+        export_tasks: list[UploadToFTPTask|ExportToDirectoryTask] = []
+        for sink_name in profile.export_sinks:
+            task = self.export_sinks[sink_name].create_task(input_link, file_name, profile.export_path, group)
+            task.add_dependency(dependency)
+            export_tasks.append(task)
+        return export_tasks
+
+    def create_blank_pages_task(self, 
+                                profile: PDFProfile, 
+                                input_task: Task, 
+                                input_link: FileArtifactLink, 
+                                file_name: str, 
+                                group: str) -> DetectBlankPagesTask|None:
+        """ Create the task detecting the blank pages of the input if enabled in the profile """
+        if not profile.remove_blank_pages:
+            return None
+        blank_task = DetectBlankPagesTask(input_link, file_name=file_name, threshold=profile.blank_page_threshold, group=group)
+        blank_task.add_dependency(input_task)
+        return blank_task
+
+    def create_ocr_tasks(self, 
+                         profile: PDFProfile, 
+                         input_task: Task, 
+                         input_link: FileArtifactLink, 
+                         file_name: str, 
+                         num_pages: int|None, 
+                         group: str,
+                         blank_task: DetectBlankPagesTask|None = None) -> tuple[list[OCRTask|SplitPDFTask|MergePDFTask], Task, FileArtifactLink]:
+        """ 
+        Create the tasks to apply OCR on the given input. Documents with more pages than the profile's ocr_shard_pages
+        are split into shards, which are processed independently and merged afterwards. If a blank pages task is given,
+        OCR is only applied to the remaining pages.
+
+        Returns the created tasks, the final task and the link to its export
+        """
+        def create_ocr_task(input_link: FileArtifactLink, file_name: str, page_range: tuple[int, int]|None = None) -> OCRTask:
+            ocr_task = OCRTask(input_link, 
+                           file_name=file_name, 
+                           language=profile.ocr_language, 
+                           optimize=profile.ocr_optimize, 
+                           deskew=profile.ocr_deskew, 
+                           rotate_pages=profile.ocr_rotate_pages,
+                           jpg_quality=profile.ocr_jpg_quality,
+                           png_quality=profile.ocr_png_quality,
+                           color_conversion_strategy=profile.ocr_color_conversion_strategy,
+                           num_jobs=self.ocr_num_jobs,
+                           tesseract_timeout=profile.ocr_tesseract_timeout,
+                           skip_pages=blank_task.blank_pages_link if blank_task is not None else None,
+                           page_range=page_range,
+                           preset=profile.output_preset,
+                           group=group
+                           )
+            if blank_task is not None:
+                ocr_task.add_dependency(blank_task)
+            return ocr_task
+
+        if num_pages is None or profile.ocr_shard_pages <= 0 or num_pages <= profile.ocr_shard_pages:
+            ocr_task = create_ocr_task(input_link, file_name)
+            ocr_task.add_dependency(input_task)
+            return [ocr_task], ocr_task, ocr_task.export_artifact_link
+        
+        page_ranges = SplitPDFTask.get_page_ranges(num_pages, profile.ocr_shard_pages)
+        logger.debug(f"Splitting '{file_name}' ({num_pages} pages) into {len(page_ranges)} shards for OCR")
+        tasks: list[OCRTask|SplitPDFTask|MergePDFTask] = []
+
+        split_task = SplitPDFTask(input_link, file_name=file_name, page_ranges=page_ranges, group=group)
+        split_task.add_dependency(input_task)
+        tasks.append(split_task)
+
+        shard_tasks: list[OCRTask] = []
+        for (start, end), shard_link in zip(page_ranges, split_task.shard_artifact_links):
+            ocr_task = create_ocr_task(shard_link, f"{file_name} (pages {start+1}-{end})", (start, end))
+            ocr_task.add_dependency(split_task)
+            shard_tasks.append(ocr_task)
+        tasks.extend(shard_tasks)
+
+        merge_task = MergePDFTask([t.export_artifact_link for t in shard_tasks], metadata_input=input_link, file_name=file_name, group=group)
+        for t in shard_tasks:
+            merge_task.add_dependency(t)
+        tasks.append(merge_task)
+
+        return tasks, merge_task, merge_task.export_artifact_link
+
+    def prune_inflight_jobs(self) -> None:
+        """ Remove the jobs whose result can no longer be shared """
+        for key, job in list(self.inflight_jobs.items()):
+            if (task := job.task()) is None or (task.state.is_final and "export" not in task.artifacts):
+                del self.inflight_jobs[key]
+
     def stop(self) -> None:
         """ Stop the server """
         if self.thread.is_alive():
             self.server.close_all()
             logger.debug(f"Stopped the FTP server")
+        self.ingest_queue.put(None)
 
 
-class ExportFTP:
+class ExportSink:
+    """ Base class of an export target. Creates the tasks exporting a file to the target """
 
-    def __init__(self) -> None:
-        self.host = config.get("EXPORT_FTP_SERVER", "host", fallback="")
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def create_task(self, input: FileArtifactLink, file_name: str, folder: str, group: str|None) -> UploadToFTPTask|ExportToDirectoryTask:
+        raise NotImplementedError(f"The given export sink does not implement a create_task() method")
+    
+    def __str__(self) -> str:
+        return f"Export sink '{self.name}'"
+
+
+class ExportFTP(ExportSink):
+    """ Export to an external FTP server """
+
+    def __init__(self, section: str = "EXPORT_FTP_SERVER", name: str = "default") -> None:
+        super().__init__(name)
+        self.host = config.get(section, "host", fallback="")
         if self.host == "":
-            raise ConfigError(f"Missing field 'host' in section 'EXPORT_FTP_SERVER'")
+            raise ConfigError(f"Missing field 'host' in section '{section}'")
 
         try:
-            self.port = config.getint("EXPORT_FTP_SERVER", "port", fallback=-1)
+            self.port = config.getint(section, "port", fallback=-1)
         except ValueError:
             self.port = -1
         if self.port <= 0 or self.port >= 2**16:
             logger.info(f"No or invalid port for export FTP server set. Defaulting to 21")
             self.port = 21
 
-        username = config.get("EXPORT_FTP_SERVER", "username", fallback=None)
+        username = config.get(section, "username", fallback=None)
         if username is None:
-            raise ConfigError(f"Missing field 'username' in section 'EXPORT_FTP_SERVER'")
+            raise ConfigError(f"Missing field 'username' in section '{section}'")
         self.username = username
 
-        password = config.get("EXPORT_FTP_SERVER", "password", fallback=None)
+        password = config.get(section, "password", fallback=None)
         if password is None:
-            raise ConfigError(f"Missing field 'password' in section 'EXPORT_FTP_SERVER'")
-        self.password = password
\ No newline at end of file
+            raise ConfigError(f"Missing field 'password' in section '{section}'")
+        self.password = password
+
+        try:
+            self.tls = config.getboolean(section, "tls", fallback=True)
+        except ValueError:
+            raise ConfigError(f"Invalid field 'tls' in section '{section}'")
+
+        if export_spool is not None:
+            export_spool.register_credentials((self.host, self.port), self.username, self.password)
+
+    def create_task(self, input: FileArtifactLink, file_name: str, folder: str, group: str|None) -> UploadToFTPTask:
+        return UploadToFTPTask(input, 
+                               file_name, 
+                               address=(self.host, self.port), 
+                               username=self.username, 
+                               password=self.password, 
+                               folder=folder, 
+                               tls=self.tls, 
+                               group=group)
+    
+    def __str__(self) -> str:
+        return f"FTP sink '{self.name}' ({self.host}:{self.port})"
+
+
+class ExportDirectory(ExportSink):
+    """ Export into a local or mounted directory. The export path of the profile is used as subdirectory """
+
+    def __init__(self, section: str, name: str) -> None:
+        super().__init__(name)
+        path = config.get(section, "path", fallback="")
+        if path.strip() == "":
+            raise ConfigError(f"Missing field 'path' in section '{section}'")
+        self.path = Path(path)
+        if not self.path.is_dir():
+            logger.warning(f"The export directory '{self.path}' of sink '{name}' does not exist")
+
+    def create_task(self, input: FileArtifactLink, file_name: str, folder: str, group: str|None) -> ExportToDirectoryTask:
+        return ExportToDirectoryTask(input, file_name, self.path / folder.strip("/"), group=group)
+    
+    def __str__(self) -> str:
+        return f"Directory sink '{self.name}' ({self.path})"
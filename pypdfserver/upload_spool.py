@@ -0,0 +1,240 @@
+""" Implements a durable spool for uploads which failed because the export server was not reachable """
+
+from .core import *
+from .ftp_pool import FTPConnectionPool, remote_file_exists, upload_file
+
+import ftplib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import NamedTuple, cast
+
+class SpoolDestination(NamedTuple):
+    """ Destination of a spooled upload. The password is not stored on disk """
+    host: str
+    port: int
+    username: str
+    folder: str
+    tls: bool
+
+    def __str__(self) -> str:
+        return f"{self.host}:{self.port}@{self.username}:{self.folder}"
+
+class SpoolEntry:
+    """ A spooled upload. The file is stored next to a JSON sidecar file holding the file name and destination """
+
+    def __init__(self, path: Path, file_name: str, destination: SpoolDestination, t_created: float) -> None:
+        self.path = path
+        self.file_name = file_name
+        self.destination = destination
+        self.t_created = t_created
+
+    @property
+    def sidecar_path(self) -> Path:
+        return self.path.with_suffix(".json")
+
+    def save(self) -> None:
+        temp_path = self.sidecar_path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump({"file_name": self.file_name, "destination": self.destination._asdict(), "t_created": self.t_created}, f)
+        os.replace(temp_path, self.sidecar_path)
+
+    @classmethod
+    def load(cls, sidecar_path: Path) -> "SpoolEntry":
+        with open(sidecar_path, "r") as f:
+            data = json.load(f)
+        return SpoolEntry(sidecar_path.with_suffix(".pdf"), data["file_name"], SpoolDestination(**data["destination"]), data["t_created"])
+
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
+        self.sidecar_path.unlink(missing_ok=True)
+
+    def __str__(self) -> str:
+        return f"Spooled upload '{self.file_name}' to '{str(self.destination)}'"
+
+class UploadSpool:
+    """
+    Keeps uploads which failed because the export server was not reachable on disk and retries them with an exponential backoff.
+    All spooled files of a destination are uploaded over a single connection once the server is reachable again.
+    Files colliding with an existing file on the server or which can not be read are moved to the 'rejected' subfolder
+    """
+
+    def __init__(self, path: Path, pool: FTPConnectionPool, min_delay: float = 30, max_delay: float = 3600) -> None:
+        self.path = path
+        self.rejected_path = path / "rejected"
+        self.pool = pool
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.entries: list[SpoolEntry] = []
+        self._credentials: dict[tuple[str, int, str], str] = {}
+        self._retry: dict[SpoolDestination, tuple[int, float]] = {} # destination -> (failed attempts, time of next attempt)
+        self.thread: threading.Thread|None = None
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.load()
+
+    def load(self) -> None:
+        """ Load the spooled uploads from disk """
+        entries: list[SpoolEntry] = []
+        for p in self.path.glob("*.json"):
+            try:
+                entry = SpoolEntry.load(p)
+            except (OSError, ValueError, KeyError, TypeError):
+                logger.warning(f"Failed to load the spooled upload '{p.name}'", exc_info=True)
+                continue
+            if not entry.path.exists():
+                logger.warning(f"Removed the spooled upload '{entry.file_name}' as its file is missing")
+                entry.remove()
+                continue
+            entries.append(entry)
+        with self.lock:
+            self.entries = sorted(entries, key=lambda e: e.t_created)
+        if len(entries) > 0:
+            logger.info(f"Loaded {len(entries)} spooled uploads")
+
+    def register_credentials(self, address: tuple[str, int], username: str, password: str) -> None:
+        """ Register the password for a server, as it is not stored in the spool """
+        with self.lock:
+            self._credentials[(address[0], address[1], username)] = password
+        self.event.set()
+
+    def add(self, source: Path, file_name: str, address: tuple[str, int], username: str, password: str, folder: str, tls: bool) -> SpoolEntry:
+        """ Copy the given file into the spool """
+        path = self.path / f"{uuid.uuid4()}.pdf"
+        try:
+            os.link(source, path)
+        except OSError:
+            shutil.copyfile(source, path)
+        entry = SpoolEntry(path, file_name, SpoolDestination(address[0], address[1], username, folder, tls), time.time())
+        entry.save()
+        with self.lock:
+            self._credentials[(address[0], address[1], username)] = password
+            self.entries.append(entry)
+            if entry.destination not in self._retry:
+                self._retry[entry.destination] = (1, time.monotonic() + self.min_delay)
+        logger.info(f"Spooled '{file_name}' for a later upload to '{str(entry.destination)}'")
+        self.event.set()
+        return entry
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._loop, name="UploadSpool", daemon=True)
+        self.thread.start()
+
+    def retry(self) -> None:
+        """ Retry all spooled uploads now """
+        with self.lock:
+            self._retry.clear()
+        self.event.set()
+
+    def _get_password(self, destination: SpoolDestination) -> str|None:
+        return self._credentials.get((destination.host, destination.port, destination.username), None)
+
+    def _next_attempt(self) -> float|None:
+        """ Returns the time of the next due destination or None if there is nothing to upload """
+        with self.lock:
+            destinations = set([e.destination for e in self.entries if self._get_password(e.destination) is not None])
+            return min([self._retry[d][1] if d in self._retry else time.monotonic() for d in destinations], default=None)
+
+    def _loop(self) -> None:
+        while True:
+            t_next = self._next_attempt()
+            self.event.wait(timeout=None if t_next is None else max(0, t_next - time.monotonic()))
+            self.event.clear()
+            try:
+                self.drain()
+            except Exception:
+                logger.error(f"Failed to process the upload spool", exc_info=True)
+
+    def drain(self) -> None:
+        """ Upload all spooled files of destinations which are due. Uploads to servers without known credentials are held back """
+        now = time.monotonic()
+        destinations: defaultdict[SpoolDestination, list[SpoolEntry]] = defaultdict(list)
+        with self.lock:
+            for e in self.entries:
+                if e.destination in self._retry and self._retry[e.destination][1] > now:
+                    continue
+                if self._get_password(e.destination) is None:
+                    continue
+                destinations[e.destination].append(e)
+
+        for destination, entries in destinations.items():
+            with self.lock:
+                password = cast(str, self._get_password(destination))
+            try:
+                self._upload(destination, password, entries)
+            except ftplib.all_errors as ex:
+                with self.lock:
+                    attempts = self._retry.get(destination, (0, 0))[0] + 1
+                    delay = min(self.min_delay * 2**(attempts - 1), self.max_delay)
+                    self._retry[destination] = (attempts, time.monotonic() + delay)
+                logger.info(f"Export server '{str(destination)}' is still not reachable ({str(ex)}). Retrying {len(entries)} spooled uploads in {delay:.0f} s")
+            else:
+                with self.lock:
+                    self._retry.pop(destination, None)
+
+    def _upload(self, destination: SpoolDestination, password: str, entries: list[SpoolEntry]) -> None:
+        """ 
+        Upload the entries over a single connection. Errors of the connection are raised, while entries with broken local files are
+        moved to the 'rejected' subfolder, so that they do not hold back the other entries of the destination
+        """
+        with self.pool.connection((destination.host, destination.port), destination.username, password, destination.folder, destination.tls) as ftp:
+            for entry in entries:
+                if (error := UploadSpool._check_file(entry)) is not None:
+                    self._reject(entry, f"the spooled file can not be read ({error})")
+                    continue
+                if remote_file_exists(ftp, entry.file_name):
+                    self._reject(entry, f"it is already present on '{str(entry.destination)}'")
+                    continue
+                try:
+                    upload_file(ftp, entry.path, entry.file_name, resume=True)
+                except OSError:
+                    # Only connection errors are passed on to retry the destination later
+                    if (error := UploadSpool._check_file(entry)) is None:
+                        raise
+                    self._reject(entry, f"the spooled file can not be read ({error})")
+                    continue
+                with self.lock:
+                    self.entries.remove(entry)
+                entry.remove()
+                logger.info(f"Uploaded spooled file '{entry.file_name}' to the remote FTP server")
+
+    @staticmethod
+    def _check_file(entry: SpoolEntry) -> str|None:
+        """ Returns the error if the spooled file can not be read """
+        try:
+            with open(entry.path, "rb"):
+                return None
+        except OSError as ex:
+            return str(ex)
+
+    def _reject(self, entry: SpoolEntry, reason: str) -> None:
+        """ Move the entry to the 'rejected' subfolder. If this fails, the entry is dropped """
+        with self.lock:
+            self.entries.remove(entry)
+        if not entry.path.exists():
+            entry.remove()
+            logger.error(f"Dropped the spooled upload '{entry.file_name}' as {reason}")
+            return
+        try:
+            self.rejected_path.mkdir(exist_ok=True)
+            path = self.rejected_path / entry.file_name
+            i = 1
+            while path.exists():
+                path = self.rejected_path / f"{Path(entry.file_name).stem} ({i}){Path(entry.file_name).suffix}"
+                i += 1
+            os.replace(entry.path, path)
+        except OSError as ex:
+            entry.remove()
+            logger.error(f"Dropped the spooled file '{entry.file_name}' as {reason}. It could not be moved to '{self.rejected_path}': {str(ex)}")
+            return
+        entry.remove()
+        logger.warning(f"Moved the spooled file '{entry.file_name}' to '{path}' as {reason}")
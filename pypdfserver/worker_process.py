@@ -0,0 +1,63 @@
+"""
+Implements the workloads executed in separate worker processes. This module is executed as a standalone script by
+pdf_worker.WorkerProcess and must therefore not import anything from pyPDFserver itself. The job is passed as JSON via
+stdin and the result is written as JSON to stdout. Log records are written to stderr
+"""
+
+import os
+import sys
+
+# When executed as a script, its directory is added to sys.path and the modules of pyPDFserver would shadow
+# standard library modules (e.g. html)
+if __name__ == "__main__" and os.path.abspath(sys.path[0]) == os.path.dirname(os.path.abspath(__file__)):
+    sys.path.pop(0)
+
+import json
+import logging
+import traceback
+from typing import Any, Callable
+
+class JobError(Exception):
+    """ Raised by a job when an expected error happens. The message is passed to the calling task """
+
+    def __init__(self, message: str, *args: object) -> None:
+        super().__init__(*args)
+        self.message = message
+
+def ocr(input_path: str, output_path: str, **kwargs: Any) -> dict[str, Any]:
+    """ Apply OCR using OCRmyPDF. The kwargs are passed to ocrmypdf.ocr() """
+    import ocrmypdf
+    import ocrmypdf.exceptions
+
+    try:
+        exit_code = ocrmypdf.ocr(input_path, output_path, **kwargs)
+    except ocrmypdf.exceptions.ExitCodeException as ex:
+        raise JobError(str(ex))
+    if not exit_code == ocrmypdf.ExitCode.ok:
+        raise JobError(exit_code.name)
+    return {}
+
+jobs: dict[str, Callable[..., dict[str, Any]]] = {
+    "ocr": ocr,
+}
+
+def main() -> int:
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(levelname)s|%(message)s"))
+    logging.getLogger().addHandler(handler)
+    logging.getLogger().setLevel(logging.DEBUG)
+
+    job = json.loads(sys.stdin.read())
+    try:
+        result = jobs[job["name"]](**job["kwargs"])
+    except JobError as ex:
+        print(json.dumps({"error": ex.message}), flush=True)
+        return 1
+    except Exception:
+        print(json.dumps({"error": "Unexpected error", "traceback": traceback.format_exc()}), flush=True)
+        return 2
+    print(json.dumps({"result": result}), flush=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())